@@ -0,0 +1,228 @@
+"""
+Runs the parse, build and payload pipeline without Streamlit, for scheduled
+weekly runs and benchmarks
+
+    python batch_run.py ORDER_SHEETS_DIR CONTACTS.xlsx --output OUTPUT_DIR
+
+Every order sheet in the directory is parsed in parallel. For each week the
+delivery notes and pick lists payloads are written, then the invoices
+payload for all the weeks and the order and seller summary CSVs. With
+--dispatch the documents are also generated by the PDF Lambdas, or by the
+local stand-in with --local-lambda, and the links and zips are written too.
+"""
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import sys
+from datetime import date
+from typing import Optional
+import boto3
+from contacts_excel_dao import ContactsExcelParser
+from create_invoices import create_invoices
+from domain import MarketPlace, ValidationReport
+from json_generators import (
+    generate_invoices_json,
+    generate_order_json,
+    generate_pick_list_json,
+    invoices_payload,
+)
+from lambda_gateway import CLIENT_CONFIG, CREATE_INVOICES_FUNCTION, LambdaGateway
+from local_lambda import LocalLambdaClient, fetch
+from order_excel_dao import NamedBytesIO, OrderExcelParser
+from order_summary_export import generate_summaries
+from pdf_jobs import JobManager, JobStatus
+from weekly_run import WeeklyRun, build_weekly_run, submit_weekly_run
+
+
+def _read(path: str) -> NamedBytesIO:
+    with open(path, "rb") as excel_file:
+        return NamedBytesIO(os.path.basename(path), excel_file.read())
+
+
+def _delivery_date(market_place: MarketPlace) -> date:
+    delivery_dates = [
+        day for day in market_place.table.dictionaries["delivery_date"] if day
+    ]
+    if not delivery_dates:
+        raise ValueError(f"Week {market_place.week} has no delivery date.")
+    return delivery_dates[0]
+
+
+def _write(path: str, data: bytes):
+    with open(path, "wb") as output_file:
+        output_file.write(data)
+
+
+def _gateway(args: argparse.Namespace) -> LambdaGateway:
+    if args.local_lambda:
+        return LambdaGateway(client_factory=LocalLambdaClient)
+    return LambdaGateway(
+        client_factory=lambda: boto3.client(
+            "lambda", config=CLIENT_CONFIG, endpoint_url=args.lambda_endpoint
+        )
+    )
+
+
+def _write_job(output: str, name: str, status: JobStatus) -> dict:
+    if status.state != "done":
+        raise RuntimeError(f"{name} failed: {status.error or status.state}")
+    if status.zip_path is not None:
+        shutil.copyfile(
+            status.zip_path, os.path.join(output, f"{status.zip_name}.zip")
+        )
+    return status.links
+
+
+def parse_arguments(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    """Reads the command line"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("order_sheets", help="directory of weekly order sheets")
+    parser.add_argument("contacts", help="contacts spreadsheet")
+    parser.add_argument("--output", default="output", help="directory to write to")
+    parser.add_argument(
+        "--invoice-date",
+        type=date.fromisoformat,
+        default=date.today(),
+        help="date of the invoices, YYYY-MM-DD (default: today)",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="processes to parse with"
+    )
+    parser.add_argument(
+        "--dispatch", action="store_true", help="generate the PDFs as well"
+    )
+    parser.add_argument(
+        "--lambda-endpoint",
+        default=os.environ.get("F2F_LAMBDA_ENDPOINT"),
+        help="Lambda endpoint URL to dispatch to, such as a local emulator",
+    )
+    parser.add_argument(
+        "--local-lambda",
+        action="store_true",
+        help="dispatch to the in-process stand-in rather than Lambda",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """Runs the pipeline, returning the exit status"""
+    args = parse_arguments(argv)
+    os.makedirs(args.output, exist_ok=True)
+
+    contacts_import = ContactsExcelParser().parse(_read(args.contacts))
+    contacts_path = os.path.abspath(args.contacts)
+    order_sheets = [
+        _read(path)
+        for path in sorted(glob.glob(os.path.join(args.order_sheets, "*.xlsx")))
+        if os.path.abspath(path) != contacts_path
+    ]
+    if not order_sheets:
+        print(f"No order sheets found in {args.order_sheets}", file=sys.stderr)
+        return 1
+
+    order_parser = OrderExcelParser(contacts_import.buyer_directory)
+    market_place_imports = order_parser.parse_many(
+        order_sheets, use_file_name_for_date=True, max_workers=args.workers
+    )
+
+    report = ValidationReport.merge(
+        [contacts_import.validation_report]
+        + [
+            market_place_import.validation_report
+            for market_place_import in market_place_imports
+        ]
+    )
+    if report.errors:
+        for error in report.errors:
+            print(error.message, file=sys.stderr)
+        return 1
+
+    markets = [
+        market_place_import.market_place
+        for market_place_import in market_place_imports
+    ]
+
+    weekly_runs: list[WeeklyRun] = []
+    for market_place in markets:
+        weekly_run = build_weekly_run(market_place, _delivery_date(market_place))
+        weekly_runs.append(weekly_run)
+        delivery_date = weekly_run.delivery_date.strftime("%Y-%m-%d")
+        prefix = os.path.join(
+            args.output, f"{delivery_date} week {market_place.week}"
+        )
+        _write(
+            f"{prefix} delivery notes.json",
+            generate_order_json(weekly_run.delivery_notes, compact=True),
+        )
+        _write(
+            f"{prefix} pick lists.json",
+            generate_pick_list_json(weekly_run.pick_lists, compact=True),
+        )
+
+    invoices = create_invoices(markets, args.invoice_date)
+    invoice_date = args.invoice_date.strftime("%Y-%m-%d")
+    _write(
+        os.path.join(args.output, f"{invoice_date} invoices.json"),
+        generate_invoices_json(invoices, compact=True),
+    )
+
+    summaries = generate_summaries(markets)
+    summaries.orders.to_csv(os.path.join(args.output, "orders.csv"), index=False)
+    summaries.sellers.to_csv(
+        os.path.join(args.output, "seller summary.csv"), index=False
+    )
+
+    print(
+        f"{len(markets)} weeks, {len(invoices)} invoices, "
+        f"{sum(len(run.delivery_notes) for run in weekly_runs)} delivery notes, "
+        f"{sum(len(run.pick_lists) for run in weekly_runs)} pick lists "
+        f"written to {args.output}"
+    )
+
+    if args.dispatch:
+        job_manager = JobManager(
+            _gateway(args),
+            max_running=4,
+            # Every job is kept until it has been written out
+            max_jobs=2 * len(weekly_runs) + 1,
+            max_retained_bytes=sys.maxsize,
+            fetch=fetch if args.local_lambda else None,
+        )
+        invoices_job = job_manager.submit(
+            CREATE_INVOICES_FUNCTION,
+            invoices_payload(invoices),
+            "invoices",
+            zip_name=f"{invoice_date} Invoice",
+        )
+        weekly_jobs = [submit_weekly_run(run, job_manager) for run in weekly_runs]
+
+        links = {
+            "invoices": _write_job(
+                args.output, "Invoices", job_manager.wait(invoices_job)
+            ),
+            "weeks": [
+                {
+                    "delivery_notes": _write_job(
+                        args.output, "Delivery notes", job_manager.wait(notes_job)
+                    ),
+                    "pick_lists": _write_job(
+                        args.output, "Pick lists", job_manager.wait(picks_job)
+                    ),
+                }
+                for notes_job, picks_job in weekly_jobs
+            ],
+        }
+        _write(
+            os.path.join(args.output, "links.json"),
+            json.dumps(links, indent=4).encode("utf-8"),
+        )
+        print(f"Generated the documents, links written to {args.output}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
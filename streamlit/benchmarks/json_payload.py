@@ -0,0 +1,111 @@
+"""
+Micro-benchmark for the JSON payloads sent to the PDF Lambdas.
+
+Builds the invoices for a synthetic week of 300 buyers and compares the
+payload size and encode time of the indented JSON with the compact encoder,
+using the standard library and, when it is installed, orjson.
+
+Run from the streamlit directory:
+
+    python benchmarks/json_payload.py
+"""
+
+import os
+import random
+import sys
+import timeit
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+import json_generators
+from domain import Buyer, Invoice, Order, Seller
+
+BUYERS = 300
+LINES_PER_BUYER = 40
+SELLERS = 30
+PRODUCE = 120
+REPEATS = 5
+
+
+def _week_of_invoices() -> list[Invoice]:
+    generator = random.Random(0)
+    delivery_date = date(2024, 6, 24)
+    sellers = [Seller(f"Farm {i}") for i in range(SELLERS)]
+    produce = [
+        (f"Produce {i}", generator.choice(["kg", "each", "bunch"]), generator.random())
+        for i in range(PRODUCE)
+    ]
+
+    invoices = []
+    for b in range(BUYERS):
+        buyer = Buyer(
+            key=f"Buyer {b}",
+            name=f"Buyer {b} College",
+            address_line_1=f"{b} High Street",
+            address_line_2=None,
+            city="Oxford",
+            postcode="OX1 1AA",
+            country="United Kingdom",
+        )
+        orders = frozenset(
+            Order(
+                produce=name,
+                unit=unit,
+                seller=generator.choice(sellers),
+                buyer=buyer,
+                variant="Organic, washed" if has_variant < 0.3 else None,
+                price=generator.randint(50, 2000),
+                quantity=float(generator.randint(1, 20)),
+                delivery_date=delivery_date,
+                source="benchmark.xlsx",
+                row=row,
+                column=b,
+            )
+            for row, (name, unit, has_variant) in enumerate(
+                generator.sample(produce, LINES_PER_BUYER)
+            )
+        )
+        invoices.append(
+            Invoice(
+                invoice_date=delivery_date,
+                buyer=buyer,
+                due_date=delivery_date + timedelta(days=14),
+                reference="F2F",
+                invoice_number=f"F2F20240624{b}",
+                orders=orders,
+            )
+        )
+    return invoices
+
+
+def _measure(label: str, encode) -> None:
+    payload = encode()
+    seconds = min(timeit.repeat(encode, number=1, repeat=REPEATS))
+    size = len(payload if isinstance(payload, bytes) else payload.encode("utf-8"))
+    print(f"{label:<22} {size / 1024:9.1f} KiB {seconds * 1000:9.2f} ms")
+
+
+def main():
+    invoices = _week_of_invoices()
+    print(f"{BUYERS} buyers, {BUYERS * LINES_PER_BUYER} invoice lines")
+
+    _measure("indented", lambda: json_generators.generate_invoices_json(invoices))
+    _measure(
+        "compact (stdlib)",
+        lambda: json_generators.encode_stdlib(
+            json_generators.invoices_payload(invoices)
+        ),
+    )
+    if json_generators.orjson is not None:
+        _measure(
+            "compact (orjson)",
+            lambda: json_generators.generate_invoices_json(invoices, compact=True),
+        )
+    else:
+        print("orjson is not installed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Memory benchmark for the Order domain objects.
+
+Parses the example order sheets repeatedly to simulate a year of weekly
+sheets held in one process, and compares the bytes retained per Order with
+the previous representation: a dataclass with a per-instance __dict__, a new
+Seller per order line and each week's own copy of the cell strings.
+
+Buyers are shared by both representations and are not counted.
+
+Run from the streamlit directory:
+
+    python benchmarks/order_memory.py
+"""
+
+import glob
+import io
+import os
+import sys
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from contacts_excel_dao import ContactsExcelParser
+from domain import Buyer, MarketPlace
+from order_excel_dao import OrderExcelParser
+
+EXAMPLE_DATA = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "example_data"
+)
+WEEKS = 52
+
+
+@dataclass(frozen=True)
+class DictSeller:
+    """Seller as it was before slots and interning"""
+
+    name: str
+
+
+@dataclass(frozen=True)
+class DictOrder:
+    """Order as it was before slots and interning"""
+
+    produce: str
+    unit: str
+    seller: DictSeller
+    buyer: Buyer
+    variant: Optional[str] = None
+    price: int = 0
+    quantity: float = 0.0
+    vat_rate: float = 0.0
+    delivery_date: Optional[date] = None
+
+
+def _open(path: str) -> io.BytesIO:
+    with open(path, "rb") as excel_file:
+        named_file = io.BytesIO(excel_file.read())
+    named_file.name = os.path.basename(path)
+    return named_file
+
+
+def _copy(value):
+    """A fresh copy of a string, as each week's workbook has its own strings"""
+    if isinstance(value, str):
+        return "".join(list(value))
+    return value
+
+
+def _to_dict_orders(market_place: MarketPlace) -> frozenset[DictOrder]:
+    week_strings: dict = {}
+    return frozenset(
+        DictOrder(
+            produce=week_strings.setdefault(order.produce, _copy(order.produce)),
+            unit=week_strings.setdefault(order.unit, _copy(order.unit)),
+            seller=DictSeller(_copy(order.seller.name)),
+            buyer=order.buyer,
+            variant=week_strings.setdefault(order.variant, _copy(order.variant)),
+            price=order.price,
+            quantity=order.quantity,
+            vat_rate=order.vat_rate,
+            delivery_date=order.delivery_date,
+        )
+        for order in market_place.orders
+    )
+
+
+def _retained_bytes(weeks: list[frozenset]) -> int:
+    """Sums the size of every distinct object held by the weeks' orders"""
+    seen: set[int] = set()
+    total = 0
+    for orders in weeks:
+        objects = [orders]
+        for order in orders:
+            objects += [
+                order,
+                getattr(order, "__dict__", None),
+                order.seller,
+                getattr(order.seller, "__dict__", None),
+                order.seller.name,
+                order.produce,
+                order.unit,
+                order.variant,
+                order.quantity,
+            ]
+        for obj in objects:
+            if obj is not None and id(obj) not in seen:
+                seen.add(id(obj))
+                total += sys.getsizeof(obj)
+    return total
+
+
+def main():
+    contacts = ContactsExcelParser().parse(
+        _open(os.path.join(EXAMPLE_DATA, "FarmToFork_GENERATOR_Contacts.xlsx"))
+    )
+    parser = OrderExcelParser(contacts.buyer_directory)
+    sheets = sorted(glob.glob(os.path.join(EXAMPLE_DATA, "OxFarmToFork*.xlsx")))
+
+    market_places = [
+        parser.parse(
+            _open(sheets[week % len(sheets)]), use_file_name_for_date=True
+        ).market_place
+        for week in range(WEEKS)
+    ]
+    order_count = sum(len(market_place.orders) for market_place in market_places)
+
+    after = _retained_bytes([market_place.orders for market_place in market_places])
+    before = _retained_bytes(
+        [_to_dict_orders(market_place) for market_place in market_places]
+    )
+
+    print(f"{WEEKS} weeks, {order_count} orders")
+    print(f"before: {before / order_count:8.1f} bytes per Order")
+    print(f"after:  {after / order_count:8.1f} bytes per Order")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,10 @@
 Module to upload the contacts to buyers
 """
 
-from domain import ValidationError, Buyer, ContactsImport, ValidationReport
+from domain import ValidationError, Buyer, BuyerDirectory, ContactsImport
 from openpyxl.worksheet.worksheet import Worksheet
-from order_excel_dao import ExcelParser
+from instrumentation import span
+from order_excel_dao import ExcelParser, ParseContext
 
 
 class ContactsExcelParser(ExcelParser):
@@ -15,7 +16,7 @@ class ContactsExcelParser(ExcelParser):
     _header_row = 1
 
     def _parse_headers(
-        self, contacts_sheet: Worksheet
+        self, contacts_sheet: Worksheet, context: ParseContext
     ) -> tuple[dict[str, int], dict[int, str], list[ValidationError]]:
         "Load in and validate the headers"
 
@@ -47,7 +48,7 @@ class ContactsExcelParser(ExcelParser):
                 index_of_header = headers.index(key)
 
             except ValueError:
-                self.validation_errors.append(
+                context.validation_errors.append(
                     ValidationError(
                         f"Header {key} could not be found in the contacts sheet."
                     )
@@ -58,7 +59,12 @@ class ContactsExcelParser(ExcelParser):
         return contact_header_dict
 
     def _load_cell(
-        self, row: tuple, key: int, row_number: int, can_be_null: bool = True
+        self,
+        row: tuple,
+        key: int,
+        row_number: int,
+        context: ParseContext,
+        can_be_null: bool = True,
     ) -> str:
         """
         Load the row from the contacts sheet
@@ -69,7 +75,7 @@ class ContactsExcelParser(ExcelParser):
         except IndexError:
             return ""
         if (item is None or item == "") and can_be_null is False:
-            self.validation_errors.append(
+            context.validation_errors.append(
                 ValidationError(
                     f"Row {row_number} and item {key} is empty and should not be."
                 )
@@ -83,6 +89,7 @@ class ContactsExcelParser(ExcelParser):
         self,
         contacts_sheet: Worksheet,
         headers_dict: dict[str, int],
+        context: ParseContext,
     ) -> tuple[list[Buyer], list[ValidationError]]:
         """
         This function takes in the contacts dataframe and returns a
@@ -107,25 +114,45 @@ class ContactsExcelParser(ExcelParser):
 
             buyer = Buyer(
                 key=self._load_cell(
-                    row, headers_dict["buyer_key"], row_number, can_be_null=False
+                    row,
+                    headers_dict["buyer_key"],
+                    row_number,
+                    context,
+                    can_be_null=False,
                 ),
                 name=self._load_cell(
-                    row, headers_dict["buyer_full_name"], row_number, can_be_null=False
+                    row,
+                    headers_dict["buyer_full_name"],
+                    row_number,
+                    context,
+                    can_be_null=False,
                 ),
                 address_line_1=self._load_cell(
-                    row, headers_dict["address_line_1"], row_number, can_be_null=False
+                    row,
+                    headers_dict["address_line_1"],
+                    row_number,
+                    context,
+                    can_be_null=False,
                 ),
                 city=self._load_cell(
-                    row, headers_dict["city"], row_number, can_be_null=False
+                    row, headers_dict["city"], row_number, context, can_be_null=False
                 ),
                 postcode=self._load_cell(
-                    row, headers_dict["postcode"], row_number, can_be_null=False
+                    row,
+                    headers_dict["postcode"],
+                    row_number,
+                    context,
+                    can_be_null=False,
                 ),
                 country=self._load_cell(
-                    row, headers_dict["country"], row_number, can_be_null=True
+                    row, headers_dict["country"], row_number, context, can_be_null=True
                 ),
                 address_line_2=self._load_cell(
-                    row, headers_dict["address_line_2"], row_number, can_be_null=True
+                    row,
+                    headers_dict["address_line_2"],
+                    row_number,
+                    context,
+                    can_be_null=True,
                 ),
             )
 
@@ -137,10 +164,21 @@ class ContactsExcelParser(ExcelParser):
         """ "
         Takes the contacts file path and returns the buyers with all their information
         """
-        self._reset_errors()
-        contacts_sheet = self._load_worksheet_from_excel(file, "Contacts")
-        headers_index = self._parse_headers(contacts_sheet)
-        buyers = self._contacts_parser(contacts_sheet, headers_index)
-        contacts_validation_report = ValidationReport(file.name, self.validation_errors)
+        context = ParseContext(source=file.name)
+        with span("parse_contacts", source=file.name) as counts:
+            contacts_sheet = self._load_worksheet_from_excel(file, "Contacts", context)
+            headers_index = self._parse_headers(contacts_sheet, context)
+            buyers = self._contacts_parser(contacts_sheet, headers_index, context)
+            counts["rows"] = contacts_sheet.max_row
+            counts["buyers"] = len(buyers)
+        for keys in BuyerDirectory(buyers).ambiguous_keys:
+            context.validation_errors.append(
+                ValidationError(
+                    "Buyer keys "
+                    + ", ".join(f"'{key}'" for key in keys)
+                    + " only differ by case or spaces, please make them unique."
+                )
+            )
+        contacts_validation_report = context.validation_report()
         contacts_import = ContactsImport(buyers, contacts_validation_report)
         return contacts_import
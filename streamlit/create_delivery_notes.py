@@ -2,6 +2,7 @@
 
 from datetime import date
 from domain import MarketPlace, DeliveryNote
+from instrumentation import span
 
 
 def create_delivery_notes(
@@ -11,31 +12,33 @@ def create_delivery_notes(
     Create the delivery notes for the buyers
     """
 
-    all_delivery_notes: list[DeliveryNote] = []
+    with span("create_delivery_notes", week=week_number) as counts:
+        all_delivery_notes: list[DeliveryNote] = []
 
-    i = 0
+        i = 0
 
-    for buyer in market_place.buyers:
-        i += 1
+        for buyer in market_place.buyers:
+            i += 1
 
-        orders = [
-            order
-            for order in market_place.orders
-            if order.buyer == buyer and order.seller.name != "No Vice Ice"
-        ]
+            orders = [
+                order
+                for order in market_place.orders_by_buyer.get(buyer, ())
+                if order.seller.name != "No Vice Ice"
+            ]
 
-        if len(orders) == 0:
-            i -= 1
-            continue
+            if len(orders) == 0:
+                i -= 1
+                continue
 
-        if orders:
-            all_delivery_notes.append(
-                DeliveryNote(
-                    note_date=delivery_date,
-                    buyer=buyer,
-                    orders=frozenset(orders),
-                    reference=f"F2FD{week_number}{delivery_date.strftime('%Y')[2:4]}{i}",
+            if orders:
+                all_delivery_notes.append(
+                    DeliveryNote(
+                        note_date=delivery_date,
+                        buyer=buyer,
+                        orders=frozenset(orders),
+                        reference=f"F2FD{week_number}{delivery_date.strftime('%Y')[2:4]}{i}",
+                    )
                 )
-            )
+        counts["documents"] = len(all_delivery_notes)
 
     return all_delivery_notes
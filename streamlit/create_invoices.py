@@ -1,48 +1,97 @@
 "Create the invoices for the buyers"
 
 from datetime import date, timedelta
-from domain import MarketPlace, Invoice, Order
+from typing import Iterable, Optional
+import numpy as np
+from domain import Buyer, MarketPlace, Invoice
+from instrumentation import span
+from order_table import OrderTable
 from dateutil.relativedelta import relativedelta
 
 
-def create_invoices(
-    market_places: list[MarketPlace], invoice_date: date
-) -> list[Invoice]:
+class InvoiceBuilder:
     """
-    Create the invoices for the buyers
+    Builds the invoices one week at a time
+
+    Each week's orders are folded into per-buyer column slices, so the week's
+    market place can be freed as soon as it has been added. Order objects are
+    only built for the invoices at the end.
     """
 
-    all_invoices: list[Invoice] = []
+    def __init__(self, invoice_date: date):
+        self.invoice_date = invoice_date
+        self._buyers: Optional[frozenset[Buyer]] = None
+        self._tables: dict[Buyer, list[OrderTable]] = {}
+
+    def add(self, market_place: MarketPlace):
+        """
+        Folds one week of orders into the per-buyer accumulators
+        """
+        if self._buyers is None:
+            self._buyers = market_place.buyers
 
-    i = 0
-    due_date = invoice_date + timedelta(days=14)
+        table = market_place.table
+        codes = table.columns["buyer"]
+        by_buyer = np.argsort(codes, kind="stable")
+        boundaries = np.flatnonzero(np.diff(codes[by_buyer])) + 1
 
-    all_orders: list[Order] = []
+        for indices in np.split(by_buyer, boundaries):
+            if len(indices) == 0:
+                continue
+            buyer = table.dictionaries["buyer"][codes[indices[0]]]
+            self._tables.setdefault(buyer, []).append(table.take(indices))
 
-    for market_place in market_places:
-        all_orders.extend(market_place.orders)
+    def build(self) -> list[Invoice]:
+        """
+        Creates the invoices from everything added so far
+        """
+        all_invoices: list[Invoice] = []
 
-    for buyer in market_places[0].buyers:
-        i += 1
+        i = 0
+        due_date = self.invoice_date + timedelta(days=14)
 
-        print(buyer)
+        for buyer in self._buyers or ():
+            i += 1
 
-        orders = [order for order in all_orders if order.buyer == buyer]
+            tables = self._tables.get(buyer)
 
-        if len(orders) == 0:
-            i -= 1
-            continue
+            if not tables:
+                i -= 1
+                continue
+
+            orders = OrderTable.concat(tables).to_orders()
 
-        if orders:
             all_invoices.append(
                 Invoice(
                     buyer=buyer,
                     due_date=due_date,
-                    invoice_date=invoice_date,
+                    invoice_date=self.invoice_date,
                     orders=frozenset(orders),
                     reference="F2F",
-                    invoice_number=f"F2F{invoice_date.strftime('%Y%m%d')}{i}",
+                    invoice_number=f"F2F{self.invoice_date.strftime('%Y%m%d')}{i}",
                 )
             )
 
-    return all_invoices
+        return all_invoices
+
+
+def create_invoices(
+    market_places: Iterable[MarketPlace], invoice_date: date
+) -> list[Invoice]:
+    """
+    Create the invoices for the buyers
+
+    market_places may be a generator, in which case only one week is held in
+    memory at a time.
+    """
+
+    with span("create_invoices") as counts:
+        builder = InvoiceBuilder(invoice_date)
+
+        for market_place in market_places:
+            builder.add(market_place)
+
+        invoices = builder.build()
+        counts["documents"] = len(invoices)
+
+    return invoices
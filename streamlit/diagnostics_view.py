@@ -0,0 +1,40 @@
+"""
+Shows where a page's last run spent its time, stage by stage
+"""
+
+import pandas as pd
+from instrumentation import begin_recording
+from lambda_gateway import LAMBDA_GATEWAY
+import streamlit as st
+
+
+def start_run_diagnostics(session_key: str):
+    """
+    Starts recording the stages of this run, keeping the recorder in
+    st.session_state[session_key]
+
+    Background jobs submitted during the run keep adding their stages to it.
+    """
+    st.session_state[session_key] = begin_recording()
+
+
+def render_run_diagnostics(session_key: str):
+    """
+    Renders the stages of the run recorded in st.session_state[session_key],
+    with the Lambda calls made since the app started
+    """
+    recorder = st.session_state.get(session_key)
+    if recorder is None:
+        return
+
+    with st.expander("Run diagnostics"):
+        rows = recorder.rows()
+        if rows:
+            st.dataframe(pd.DataFrame(rows), hide_index=True)
+        else:
+            st.caption("No stages recorded yet.")
+
+        invocations = LAMBDA_GATEWAY.metrics.summary()
+        if invocations:
+            st.markdown("Lambda calls since the app started")
+            st.dataframe(pd.DataFrame(invocations).round(1), hide_index=True)
@@ -0,0 +1,151 @@
+"""
+Remembers the link of every generated document by a hash of its content, so
+a re-run only renders the documents that changed
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, MutableMapping, Optional
+
+
+def content_hash(function_name: str, document: dict) -> str:
+    """
+    A canonical hash of a document as sent to the PDF function
+
+    The payload carries only what is printed, so order identity (source
+    sheet, row and column) is not part of it. Lines are sorted, as their
+    order comes from iterating a set.
+    """
+    canonical = dict(document)
+    if "lines" in canonical:
+        canonical["lines"] = sorted(
+            json.dumps(line, sort_keys=True, separators=(",", ":"))
+            for line in canonical["lines"]
+        )
+    encoded = json.dumps(
+        [function_name, canonical], sort_keys=True, separators=(",", ":")
+    ).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+# Prefix of the store entries mapping a link back to the hash it holds
+_LINK_PREFIX = "link:"
+
+# The bucket deletes documents 30 days after they are written, so links are
+# forgotten a little before then
+MAX_AGE = 25 * 24 * 60 * 60
+
+
+class DocumentCache:
+    """
+    A bounded, least recently used map of content hash to document link
+
+    The PDF functions write each document to a fixed object key, so a link
+    only holds the content it was last recorded for. Recording a link again
+    forgets the hash it held before, so a stale hash can never return a link
+    that now holds another document. Links older than max_age seconds are
+    forgotten too, before the bucket's lifecycle rule deletes the document.
+
+    If a store is given, such as a shelve or a dict standing in for one,
+    links are also written to it, with the time they were recorded, and
+    looked up there on a miss.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 5000,
+        store: Optional[MutableMapping[str, str]] = None,
+        max_age: float = MAX_AGE,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.max_entries = max_entries
+        self.store = store
+        self.max_age = max_age
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._links: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self._hashes: dict[str, str] = {}
+
+    def get(self, key: str) -> Optional[str]:
+        """The link of a previously generated document, if known and current"""
+        with self._lock:
+            entry = self._links.get(key)
+            if entry is None and self.store is not None:
+                entry = self._load(key)
+                if entry is not None:
+                    self._remember(key, *entry)
+            if entry is None:
+                return None
+            link, created = entry
+            if self.clock() - created > self.max_age:
+                self._forget(key, link)
+                return None
+            self._links.move_to_end(key)
+            return link
+
+    def put(self, key: str, link: str):
+        """Records the link of a generated document"""
+        with self._lock:
+            created = self.clock()
+            self._remember(key, link, created)
+            if self.store is not None:
+                previous = self.store.get(_LINK_PREFIX + link)
+                if previous is not None and previous != key:
+                    self.store.pop(previous, None)
+                self.store[key] = f"{created!r} {link}"
+                self.store[_LINK_PREFIX + link] = key
+
+    def _load(self, key: str) -> Optional[tuple[str, float]]:
+        value = self.store.get(key)
+        if value is None:
+            return None
+        created, _, link = value.partition(" ")
+        try:
+            created = float(created)
+        except ValueError:
+            # Written before links carried the time they were recorded
+            del self.store[key]
+            return None
+        if self.store.get(_LINK_PREFIX + link) != key:
+            # The link has since been recorded for other content
+            del self.store[key]
+            return None
+        return link, created
+
+    def _remember(self, key: str, link: str, created: float):
+        previous = self._hashes.get(link)
+        if previous is not None and previous != key:
+            self._links.pop(previous, None)
+        self._links[key] = (link, created)
+        self._links.move_to_end(key)
+        self._hashes[link] = key
+        while len(self._links) > self.max_entries:
+            evicted_key, (evicted_link, _) = self._links.popitem(last=False)
+            if self._hashes.get(evicted_link) == evicted_key:
+                del self._hashes[evicted_link]
+
+    def _forget(self, key: str, link: str):
+        self._links.pop(key, None)
+        if self._hashes.get(link) == key:
+            del self._hashes[link]
+        if self.store is not None:
+            self.store.pop(key, None)
+            if self.store.get(_LINK_PREFIX + link) == key:
+                del self.store[_LINK_PREFIX + link]
+
+    def clear(self):
+        """Forgets every link, for example after the bucket is emptied"""
+        with self._lock:
+            self._links.clear()
+            self._hashes.clear()
+            if self.store is not None:
+                self.store.clear()
+
+    def __len__(self) -> int:
+        return len(self._links)
+
+
+DOCUMENT_CACHE = DocumentCache()
@@ -3,12 +3,16 @@ Dataclasses for the domain model
 """
 
 import streamlit as st
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional
 from datetime import date
 
+if TYPE_CHECKING:
+    from order_table import OrderTable
 
-@dataclass(frozen=True)
+
+@dataclass(frozen=True, slots=True)
 class Seller:
     """
     Seller dataclass
@@ -17,7 +21,7 @@ class Seller:
     name: str
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Buyer:
     """
     Buyer dataclass
@@ -32,10 +36,71 @@ class Buyer:
     address_line_2: Optional[str] = None
 
 
-@dataclass(frozen=True)
+class BuyerDirectory:
+    """
+    Index of the buyers by their spreadsheet key, built once from the contacts
+    and shared by every parse that uses them.
+
+    Keys are looked up exactly first, then trimmed and case-folded. Keys that
+    only differ by case or spaces are ambiguous: they are listed in
+    ambiguous_keys and are never resolved by the trimmed, case-folded lookup.
+    """
+
+    def __init__(self, buyers: Iterable[Buyer]):
+        self.buyers = frozenset(buyers)
+
+        by_key: dict[str, list[Buyer]] = {}
+        by_normalised_key: dict[str, list[Buyer]] = {}
+        for buyer in sorted(self.buyers, key=lambda buyer: str(buyer.key)):
+            by_key.setdefault(buyer.key, []).append(buyer)
+            by_normalised_key.setdefault(self.normalise_key(buyer.key), []).append(
+                buyer
+            )
+
+        self._by_key = {
+            key: buyers[0] for key, buyers in by_key.items() if len(buyers) == 1
+        }
+        self._by_normalised_key = {
+            key: buyers[0]
+            for key, buyers in by_normalised_key.items()
+            if len(buyers) == 1
+        }
+        self.ambiguous_keys: list[list[str]] = [
+            [buyer.key for buyer in buyers]
+            for buyers in by_normalised_key.values()
+            if len(buyers) > 1
+        ]
+
+    @staticmethod
+    def normalise_key(key: str) -> str:
+        """Trims and case-folds a buyer key"""
+        return str(key).strip().casefold()
+
+    def find(self, key: str) -> Optional[Buyer]:
+        """Returns the buyer with the given key, or None if there is none"""
+        buyer = self._by_key.get(key)
+        if buyer is None:
+            buyer = self._by_normalised_key.get(self.normalise_key(key))
+        return buyer
+
+    def __contains__(self, key: str) -> bool:
+        return self.find(key) is not None
+
+    def __iter__(self) -> Iterator[Buyer]:
+        return iter(self.buyers)
+
+    def __len__(self) -> int:
+        return len(self.buyers)
+
+
+@dataclass(frozen=True, slots=True, eq=False)
 class Order:
     """
     Complete order dataclass
+
+    An order parsed from a sheet is identified by where it came from (source
+    file, row and buyer column), so identical lines stay distinct. The hash is
+    computed once, making frozensets of orders cheap to build.
     """
 
     produce: str
@@ -47,9 +112,67 @@ class Order:
     quantity: float = 0.0
     vat_rate: float = 0.0
     delivery_date: Optional[date] = None
+    source: Optional[str] = None
+    row: Optional[int] = None
+    column: Optional[int] = None
+    _hash: int = field(init=False, repr=False)
 
+    def __post_init__(self):
+        object.__setattr__(self, "_hash", hash(self.identity))
 
-@dataclass(frozen=True)
+    @property
+    def identity(self) -> tuple:
+        """
+        The source file, row and buyer column of the order, or all of its
+        values if it was not parsed from a sheet
+        """
+        if self.source is None:
+            return (
+                self.produce,
+                self.unit,
+                self.seller,
+                self.buyer,
+                self.variant,
+                self.price,
+                self.quantity,
+                self.vat_rate,
+                self.delivery_date,
+            )
+        return (self.source, self.row, self.column)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Order):
+            return NotImplemented
+        return self is other or (
+            self._hash == other._hash and self.identity == other.identity
+        )
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __reduce__(self):
+        # String hashes differ between processes, so the hash is recomputed
+        # when an order is unpickled rather than copied
+        return (
+            Order,
+            (
+                self.produce,
+                self.unit,
+                self.seller,
+                self.buyer,
+                self.variant,
+                self.price,
+                self.quantity,
+                self.vat_rate,
+                self.delivery_date,
+                self.source,
+                self.row,
+                self.column,
+            ),
+        )
+
+
+@dataclass(frozen=True, slots=True)
 class DeliveryNote:
     """
     Delivery note dataclass
@@ -61,7 +184,7 @@ class DeliveryNote:
     orders: frozenset[Order]
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class PickList:
     """
     Pick list dataclass
@@ -73,7 +196,7 @@ class PickList:
     orders: frozenset[Order]
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Invoice:
     """
     Invoice dataclass
@@ -91,15 +214,48 @@ class Invoice:
 class MarketPlace:
     """
     Marketplace data class with all the information from one week of orders
+
+    The orders are stored in a columnar OrderTable; the order objects are only
+    built when first used.
     """
 
     sellers: frozenset[Seller]
     buyers: frozenset[Buyer]
-    orders: frozenset[Order]
+    table: "OrderTable"
     week: int
 
+    @cached_property
+    def orders(self) -> frozenset[Order]:
+        """
+        The orders as objects, built from the table on first use
+        """
+        return frozenset(self.table.to_orders())
 
-@dataclass(frozen=True)
+    def _group_orders(self, key) -> dict:
+        """
+        Groups the orders in one pass, keeping the iteration order of orders
+        """
+        groups: dict = {}
+        for order in self.orders:
+            groups.setdefault(key(order), []).append(order)
+        return {group: tuple(orders) for group, orders in groups.items()}
+
+    @cached_property
+    def orders_by_buyer(self) -> dict[Buyer, tuple[Order, ...]]:
+        """
+        The orders of each buyer, built on first use
+        """
+        return self._group_orders(lambda order: order.buyer)
+
+    @cached_property
+    def orders_by_seller(self) -> dict[Seller, tuple[Order, ...]]:
+        """
+        The orders of each seller, built on first use
+        """
+        return self._group_orders(lambda order: order.seller)
+
+
+@dataclass(frozen=True, slots=True)
 class ValidationError:
     """
     Error message for a validation error
@@ -108,7 +264,7 @@ class ValidationError:
     message: str
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class ValidationReport:
     """
     Holds and handles the validation errors
@@ -116,6 +272,23 @@ class ValidationReport:
 
     source: str
     errors: list[ValidationError]
+    rows_scanned: int = 0
+
+    @classmethod
+    def merge(cls, reports: list["ValidationReport"]) -> "ValidationReport":
+        """
+        Combines the reports of several files into one, prefixing each error
+        with the file it came from
+        """
+        return cls(
+            source=", ".join(report.source for report in reports),
+            errors=[
+                ValidationError(f"{report.source}: {error.message}")
+                for report in reports
+                for error in report.errors
+            ],
+            rows_scanned=sum(report.rows_scanned for report in reports),
+        )
 
     def _generate_error_message(self):
         """
@@ -140,7 +313,7 @@ class ValidationReport:
             st.stop()
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class MarketPlaceImport:
     """
     Class for the data out of the marketplace spreasheet
@@ -158,3 +331,10 @@ class ContactsImport:
 
     buyers: frozenset[Buyer]
     validation_report: ValidationReport
+
+    @cached_property
+    def buyer_directory(self) -> BuyerDirectory:
+        """
+        Index of the buyers, built on first use and kept with the import
+        """
+        return BuyerDirectory(self.buyers)
@@ -0,0 +1,115 @@
+"""
+Lightweight timing spans for the stages of a run: parse, build, serialise,
+invoke and zip
+
+Each span is written as one JSON log line to the f2f.timing logger, and is
+also kept by the recorder of the current run, if one has been started.
+"""
+
+import contextvars
+import json
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import Executor, Future
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Iterator, Optional
+
+logger = logging.getLogger("f2f.timing")
+if not logger.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+@dataclass(frozen=True)
+class Span:
+    """
+    One timed stage and what it processed
+    """
+
+    name: str
+    start: float
+    seconds: float
+    counts: dict
+
+
+class SpanRecorder:
+    """
+    Collects the spans of one run, from any thread it is propagated to
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.spans: list[Span] = []
+
+    def add(self, span: Span):
+        """Keeps a finished span"""
+        with self._lock:
+            self.spans.append(span)
+
+    def rows(self) -> list[dict]:
+        """The spans in start order, as rows for a table"""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.start)
+        return [
+            {
+                "stage": span.name,
+                "start_ms": round(1000 * (span.start - self.started), 1),
+                "wall_ms": round(1000 * span.seconds, 1),
+                **span.counts,
+            }
+            for span in spans
+        ]
+
+
+_recorder: contextvars.ContextVar[Optional[SpanRecorder]] = contextvars.ContextVar(
+    "f2f_span_recorder", default=None
+)
+
+
+def begin_recording() -> SpanRecorder:
+    """
+    Starts a new recorder for the rest of the current run, such as one
+    Streamlit script run, and returns it
+    """
+    recorder = SpanRecorder()
+    _recorder.set(recorder)
+    return recorder
+
+
+@contextmanager
+def span(name: str, **counts) -> Iterator[dict]:
+    """
+    Times the block as a span called name
+
+    Yields the span's counts, so the block can add rows, documents or
+    payload bytes once it knows them.
+    """
+    start = time.perf_counter()
+    try:
+        yield counts
+    finally:
+        seconds = time.perf_counter() - start
+        logger.info(
+            json.dumps(
+                {"span": name, "wall_ms": round(1000 * seconds, 3), **counts},
+                default=str,
+            )
+        )
+        recorder = _recorder.get()
+        if recorder is not None:
+            recorder.add(Span(name, start, seconds, counts))
+
+
+def submit_in_context(executor: Executor, function: Callable, *args) -> Future:
+    """
+    Submits to a thread pool with the caller's context, so the spans of the
+    work are kept by the caller's recorder
+    """
+    return executor.submit(contextvars.copy_context().run, function, *args)
@@ -0,0 +1,63 @@
+"""
+Shows a background PDF job's progress on a page, polling until it finishes
+"""
+
+import time
+from pdf_jobs import JOB_MANAGER
+import streamlit as st
+
+POLL_SECONDS = 1.0
+
+
+def render_job(
+    session_key: str, document_label: str, download_label: str, poll: bool = True
+) -> bool:
+    """
+    Renders the job whose ID is held in st.session_state[session_key], and
+    reruns the page until it has finished unless poll is False
+
+    Returns whether there is no job left running.
+    """
+    job_id = st.session_state.get(session_key)
+    if job_id is None:
+        return True
+
+    status = JOB_MANAGER.status(job_id)
+    if status is None:
+        st.info("This run has expired, please generate again.")
+        del st.session_state[session_key]
+        return True
+
+    st.markdown("---")
+    st.progress(
+        status.progress,
+        text=f"{len(status.links)} of {status.total} generated "
+        f"in {status.elapsed:.0f} s",
+    )
+    for name, link in status.links.items():
+        encoded_link = link.replace(" ", "%20")
+        st.markdown(f"[{name} {document_label}]({encoded_link})")
+
+    if status.state == "failed":
+        st.error(f"Generation failed: {status.error}")
+        del st.session_state[session_key]
+    elif status.state == "done" and status.zip_name is not None:
+        zip_data = status.read_zip()
+        if zip_data is None:
+            st.info("This run's zip has expired, please generate again.")
+        else:
+            st.download_button(
+                download_label,
+                zip_data,
+                file_name=f"{status.zip_name}.zip",
+                mime="application/zip",
+            )
+    elif poll:
+        rerun_soon()
+    return status.finished
+
+
+def rerun_soon():
+    """Reruns the page after a short wait, to refresh running jobs"""
+    time.sleep(POLL_SECONDS)
+    st.rerun()
@@ -1,145 +1,224 @@
 "JSON Generators for the Streamlit app"
 
 import json
-from domain import DeliveryNote, Invoice, PickList
+from datetime import date
+from functools import lru_cache
+from typing import Union
+from domain import Buyer, DeliveryNote, Invoice, PickList, Seller
+from instrumentation import span
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-def generate_order_json(orders: list[DeliveryNote]) -> list[dict]:
+_COMPACT_ENCODER = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False)
+
+
+@lru_cache(maxsize=1024)
+def _date_string(day: date) -> str:
+    """The payload format of a date, formatted once per distinct date"""
+    return day.strftime("%Y-%m-%d")
+
+
+@lru_cache(maxsize=4096)
+def _buyer_fields(buyer: Buyer) -> dict:
+    """The address fields of a buyer, shared by every document for them"""
+    return {
+        "name": buyer.name,
+        "address1": buyer.address_line_1,
+        "address2": buyer.address_line_2,
+        "city": buyer.city,
+        "postcode": buyer.postcode,
+        "country": buyer.country,
+    }
+
+
+@lru_cache(maxsize=4096)
+def _seller_object(seller: Seller) -> dict:
+    """The seller sub-object of a pick list"""
+    return {"name": seller.name}
+
+
+def encode_stdlib(payload: dict) -> bytes:
+    """Encodes a payload as compact UTF-8 JSON with the standard library"""
+    return _COMPACT_ENCODER.encode(payload).encode("utf-8")
+
+
+def encode_payload(payload: dict) -> bytes:
     """
-    Generate JSON for the orders
+    Encodes a payload as compact UTF-8 JSON, using orjson when it is installed
+    """
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return encode_stdlib(payload)
+
+
+def _dumps(payload: dict, key: str, compact: bool) -> Union[str, bytes]:
+    with span(
+        "serialise", key=key, documents=len(payload[key]), compact=compact
+    ) as counts:
+        if compact:
+            data = encode_payload(payload)
+            counts["payload_bytes"] = len(data)
+        else:
+            data = json.dumps(payload, indent=4)
+            counts["payload_bytes"] = len(data.encode("utf-8"))
+    return data
+
+
+def delivery_notes_payload(orders: list[DeliveryNote]) -> dict:
+    """
+    Build the payload for the delivery notes
     """
 
     okay = {"orders": []}
 
-    for note in orders:
-        buyer = {
-            "name": note.buyer.name,
-            "address1": note.buyer.address_line_1,
-            "address2": note.buyer.address_line_2,
-            "city": note.buyer.city,
-            "postcode": note.buyer.postcode,
-            "country": note.buyer.country,
-            "number": note.reference,
-        }
-
-        lines = []
-
-        for line in note.orders:
-            if line.variant is None:
-                variant = ""
-            else:
-                variant = line.variant[:35]
+    with span("build_payload", key="orders", documents=len(orders)):
+        for note in orders:
+            buyer = {**_buyer_fields(note.buyer), "number": note.reference}
 
-            order = {
-                "produce": line.produce,
-                "variant": variant,
-                "unit": line.unit,
-                "price": line.price,
-                "qty": line.quantity,
-                "seller": line.seller.name,
-            }
+            lines = []
+
+            for line in note.orders:
+                if line.variant is None:
+                    variant = ""
+                else:
+                    variant = line.variant[:35]
+
+                order = {
+                    "produce": line.produce,
+                    "variant": variant,
+                    "unit": line.unit,
+                    "price": line.price,
+                    "qty": line.quantity,
+                    "seller": line.seller.name,
+                }
 
-            lines.append(order)
+                lines.append(order)
 
-        order = {
-            "date": note.note_date.strftime("%Y-%m-%d"),
-            "buyer": buyer,
-            "lines": lines,
-        }
+            order = {
+                "date": _date_string(note.note_date),
+                "buyer": buyer,
+                "lines": lines,
+            }
 
-        okay["orders"].append(order)
+            okay["orders"].append(order)
 
-    return json.dumps(okay, indent=4)
+    return okay
 
 
-def generate_invoices_json(invoices: list[Invoice]) -> list[dict]:
+def invoices_payload(invoices: list[Invoice]) -> dict:
     """
-    Generate JSON for the invoices
+    Build the payload for the invoices
     """
 
     okay = {"invoices": []}
 
-    for invoice in invoices:
-        buyer = {
-            "name": invoice.buyer.name,
-            "address1": invoice.buyer.address_line_1,
-            "address2": invoice.buyer.address_line_2,
-            "city": invoice.buyer.city,
-            "postcode": invoice.buyer.postcode,
-            "country": invoice.buyer.country,
-            "number": invoice.invoice_number,
-        }
-
-        lines = []
-
-        for line in invoice.orders:
-            if line.variant is None:
-                variant = ""
-            else:
-                variant = " - " + line.variant[:35]
+    with span("build_payload", key="invoices", documents=len(invoices)):
+        for invoice in invoices:
+            buyer = {**_buyer_fields(invoice.buyer), "number": invoice.invoice_number}
 
-            order = {
-                "item": line.produce + variant,
-                "price": line.price,
-                "qty": line.quantity,
-                "seller": line.seller.name,
-                "vat_rate": line.vat_rate,
-                "date": line.delivery_date.strftime("%Y-%m-%d"),
-            }
+            lines = []
+
+            for line in invoice.orders:
+                if line.variant is None:
+                    variant = ""
+                else:
+                    variant = " - " + line.variant[:35]
 
-            lines.append(order)
+                order = {
+                    "item": line.produce + variant,
+                    "price": line.price,
+                    "qty": line.quantity,
+                    "seller": line.seller.name,
+                    "vat_rate": line.vat_rate,
+                    "date": _date_string(line.delivery_date),
+                }
 
-        order = {
-            "date": invoice.invoice_date.strftime("%Y-%m-%d"),
-            "due_date": invoice.due_date.strftime("%Y-%m-%d"),
-            "reference": invoice.reference,
-            "buyer": buyer,
-            "lines": lines,
-        }
+                lines.append(order)
+
+            order = {
+                "date": _date_string(invoice.invoice_date),
+                "due_date": _date_string(invoice.due_date),
+                "reference": invoice.reference,
+                "buyer": buyer,
+                "lines": lines,
+            }
 
-        okay["invoices"].append(order)
+            okay["invoices"].append(order)
 
-    return json.dumps(okay, indent=4)
+    return okay
 
 
-def generate_pick_list_json(pick_lists: list[PickList]) -> list[dict]:
+def pick_lists_payload(pick_lists: list[PickList]) -> dict:
     """
-    Generate JSON for the pick lists
+    Build the payload for the pick lists
     """
 
     pick_lists_json = {"picks": []}
 
-    for pick_list in pick_lists:
-        seller = {
-            "name": pick_list.seller.name,
-        }
+    with span("build_payload", key="picks", documents=len(pick_lists)):
+        for pick_list in pick_lists:
+            lines = []
+
+            for line in pick_list.orders:
+                if line.variant is None:
+                    variant = ""
+                else:
+                    variant = line.variant[:35]
+
+                order = {
+                    "produce": line.produce,
+                    "variant": variant,
+                    "unit": line.unit,
+                    "price": line.price,
+                    "qty": line.quantity,
+                    "buyer": line.buyer.name,
+                }
+
+                lines.append(order)
+
+            pick_list_json = {
+                "date": _date_string(pick_list.monday_of_order_week),
+                "seller": _seller_object(pick_list.seller),
+                "reference": pick_list.reference,
+                "lines": lines,
+            }
 
-        lines = []
+            pick_lists_json["picks"].append(pick_list_json)
 
-        for line in pick_list.orders:
-            if line.variant is None:
-                variant = ""
-            else:
-                variant = line.variant[:35]
+    return pick_lists_json
 
-            order = {
-                "produce": line.produce,
-                "variant": variant,
-                "unit": line.unit,
-                "price": line.price,
-                "qty": line.quantity,
-                "buyer": line.buyer.name,
-            }
 
-            lines.append(order)
+def generate_order_json(
+    orders: list[DeliveryNote], compact: bool = False
+) -> Union[str, bytes]:
+    """
+    Generate JSON for the orders
 
-        pick_list_json = {
-            "date": pick_list.monday_of_order_week.strftime("%Y-%m-%d"),
-            "seller": seller,
-            "reference": pick_list.reference,
-            "lines": lines,
-        }
+    With compact, the JSON is unindented UTF-8 bytes, ready to send to Lambda.
+    """
+    return _dumps(delivery_notes_payload(orders), "orders", compact)
+
+
+def generate_invoices_json(
+    invoices: list[Invoice], compact: bool = False
+) -> Union[str, bytes]:
+    """
+    Generate JSON for the invoices
 
-        pick_lists_json["picks"].append(pick_list_json)
+    With compact, the JSON is unindented UTF-8 bytes, ready to send to Lambda.
+    """
+    return _dumps(invoices_payload(invoices), "invoices", compact)
 
-    return json.dumps(pick_lists_json, indent=4)
+
+def generate_pick_list_json(
+    pick_lists: list[PickList], compact: bool = False
+) -> Union[str, bytes]:
+    """
+    Generate JSON for the pick lists
+
+    With compact, the JSON is unindented UTF-8 bytes, ready to send to Lambda.
+    """
+    return _dumps(pick_lists_payload(pick_lists), "picks", compact)
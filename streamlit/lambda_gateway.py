@@ -0,0 +1,335 @@
+"""
+One shared gateway to the PDF Lambdas, so the boto3 client and its
+connections are set up once per process rather than on every click
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional, Union
+import boto3
+from botocore.config import Config
+from botocore.exceptions import (
+    ClientError,
+    ConnectionClosedError,
+    ConnectTimeoutError,
+    ConnectionError as BotocoreConnectionError,
+    ReadTimeoutError,
+)
+from instrumentation import span
+
+REGION = "eu-west-2"
+CREATE_ORDERS_FUNCTION = "arn:aws:lambda:eu-west-2:850434255294:function:create_orders"
+CREATE_INVOICES_FUNCTION = (
+    "arn:aws:lambda:eu-west-2:850434255294:function:create_invoices"
+)
+CREATE_PICKS_FUNCTION = "arn:aws:lambda:eu-west-2:850434255294:function:create_picks"
+
+# The most invocations ever in flight, which the connection pool must cover
+MAX_CONCURRENCY = 32
+
+THROTTLING_ERRORS = frozenset(
+    {"TooManyRequestsException", "ThrottlingException", "Throttling"}
+)
+# The errors botocore's standard retry mode treats as transient
+TRANSIENT_ERRORS = frozenset(
+    {
+        "ServiceException",
+        "RequestTimeout",
+        "RequestTimeoutException",
+        "PriorRequestNotComplete",
+    }
+)
+TRANSIENT_STATUSES = frozenset({500, 502, 503, 504})
+# A read timeout is not among them: the function may still be rendering, and
+# with the read timeout at Lambda's own limit, each retry could wait 15 minutes
+TRANSIENT_EXCEPTIONS = (BotocoreConnectionError, ConnectionClosedError)
+
+CLIENT_CONFIG = Config(
+    region_name=REGION,
+    connect_timeout=5,
+    # PDF rendering for a chunk can take minutes; Lambda stops at 15, so a
+    # read timeout means the call has failed and is not retried
+    read_timeout=900,
+    max_pool_connections=MAX_CONCURRENCY,
+    tcp_keepalive=True,
+    # Throttles, and the transient and 5xx errors botocore would retry, are
+    # retried by the gateway instead, so throttles can slow the adaptive limit
+    retries={"mode": "standard", "total_max_attempts": 1},
+)
+
+
+def _is_throttle(error: ClientError) -> bool:
+    code = error.response.get("Error", {}).get("Code")
+    status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    return code in THROTTLING_ERRORS or status == 429
+
+
+def _is_transient(error: ClientError) -> bool:
+    code = error.response.get("Error", {}).get("Code")
+    status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    return code in TRANSIENT_ERRORS or status in TRANSIENT_STATUSES
+
+
+class AdaptiveConcurrencyLimit:
+    """
+    Limits in-flight invocations with additive increase and multiplicative
+    decrease: the limit grows by about one per round of healthy calls and is
+    halved on a throttle or timeout
+
+    A call is healthy if it succeeds within latency_tolerance times the
+    smoothed latency. Only one decrease is made per round, however many of
+    the calls in flight at the time are throttled.
+    """
+
+    def __init__(
+        self,
+        initial: int = 4,
+        minimum: int = 1,
+        maximum: int = MAX_CONCURRENCY,
+        decrease_factor: float = 0.5,
+        latency_tolerance: float = 2.0,
+    ):
+        self._condition = threading.Condition()
+        self._limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self._generation = 0
+        self._latency: Optional[float] = None
+
+    @property
+    def limit(self) -> int:
+        """The number of invocations currently allowed in flight"""
+        return int(self._limit)
+
+    def acquire(self) -> int:
+        """
+        Waits for a free slot and takes it, returning the generation to pass
+        to record_overload
+        """
+        with self._condition:
+            while self.in_flight >= int(self._limit):
+                self._condition.wait()
+            self.in_flight += 1
+            return self._generation
+
+    def release(self):
+        """Frees a slot taken by acquire"""
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def record_success(self, seconds: float):
+        """Grows the limit additively if the call was quick enough"""
+        with self._condition:
+            healthy = (
+                self._latency is None
+                or seconds <= self.latency_tolerance * self._latency
+            )
+            self._latency = (
+                seconds
+                if self._latency is None
+                else 0.8 * self._latency + 0.2 * seconds
+            )
+            if healthy:
+                self._limit = min(self.maximum, self._limit + 1 / self._limit)
+                self._condition.notify_all()
+
+    def record_overload(self, generation: int):
+        """Cuts the limit after a throttle or timeout"""
+        with self._condition:
+            if generation != self._generation:
+                return
+            self._generation += 1
+            self._limit = max(self.minimum, self._limit * self.decrease_factor)
+
+
+class InvocationMetrics:
+    """
+    Latency and outcome of the most recent invocations, per function
+    """
+
+    def __init__(self, max_records: int = 1000):
+        self._lock = threading.Lock()
+        self._records: deque = deque(maxlen=max_records)
+
+    def record(
+        self,
+        function_name: str,
+        seconds: float,
+        attempts: int,
+        ok: bool,
+        concurrency_limit: int,
+    ):
+        """Records one invocation, including any retries"""
+        with self._lock:
+            self._records.append(
+                (function_name, seconds, attempts, ok, concurrency_limit)
+            )
+
+    def summary(self) -> list[dict]:
+        """Call count, retries, failures and latency percentiles per function"""
+        with self._lock:
+            records = list(self._records)
+
+        by_function: dict[str, list] = {}
+        for record in records:
+            by_function.setdefault(record[0].rsplit(":", 1)[-1], []).append(record)
+
+        summary = []
+        for function_name, calls in sorted(by_function.items()):
+            latencies = sorted(call[1] for call in calls)
+            summary.append(
+                {
+                    "function": function_name,
+                    "calls": len(calls),
+                    "retries": sum(call[2] - 1 for call in calls),
+                    "failures": sum(not call[3] for call in calls),
+                    "mean_ms": 1000 * sum(latencies) / len(latencies),
+                    "p95_ms": 1000 * latencies[int(0.95 * (len(latencies) - 1))],
+                    "max_ms": 1000 * latencies[-1],
+                    "concurrency_limit": calls[-1][4],
+                }
+            )
+        return summary
+
+
+class LambdaGateway:
+    """
+    Invokes Lambdas through one lazily created, process-wide boto3 client,
+    retrying throttled calls, and transient connection and server errors, with
+    jittered exponential backoff
+
+    The calls in flight are bounded by an AdaptiveConcurrencyLimit shared by
+    every function, as the Lambda concurrency limit is per account.
+    """
+
+    def __init__(
+        self,
+        client_factory: Optional[Callable] = None,
+        max_attempts: int = 6,
+        max_transient_attempts: int = 3,
+        base_delay: float = 0.2,
+        max_delay: float = 10.0,
+        sleep: Callable[[float], None] = time.sleep,
+        concurrency: Optional[AdaptiveConcurrencyLimit] = None,
+    ):
+        self._client_factory = client_factory or (
+            lambda: boto3.client("lambda", config=CLIENT_CONFIG)
+        )
+        self._client = None
+        self._client_lock = threading.Lock()
+        self.max_attempts = max_attempts
+        self.max_transient_attempts = max_transient_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._sleep = sleep
+        self.metrics = InvocationMetrics()
+        self.concurrency = concurrency or AdaptiveConcurrencyLimit()
+
+    @property
+    def client(self):
+        """The shared boto3 Lambda client, created on first use"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._client_factory()
+        return self._client
+
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter delay before retrying after the given failed attempt"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def invoke(self, function_name: str, payload: Union[bytes, str]) -> dict:
+        """
+        Invokes a Lambda synchronously and returns its decoded JSON result
+
+        Raises the error once throttling outlasts max_attempts, or transient
+        errors outlast max_transient_attempts, at once on a read timeout, and
+        a RuntimeError if the function itself failed.
+        """
+        with span(
+            "invoke",
+            function=function_name.rsplit(":", 1)[-1],
+            payload_bytes=len(payload),
+        ) as counts:
+            start = time.perf_counter()
+            attempts = 0
+            transient_failures = 0
+            ok = False
+            try:
+                while True:
+                    attempts += 1
+                    generation = self.concurrency.acquire()
+                    try:
+                        attempt_start = time.perf_counter()
+                        response = self.client.invoke(
+                            FunctionName=function_name,
+                            InvocationType="RequestResponse",
+                            LogType="Tail",
+                            Payload=payload,
+                        )
+                        self.concurrency.record_success(
+                            time.perf_counter() - attempt_start
+                        )
+                        break
+                    except ClientError as error:
+                        if _is_throttle(error):
+                            self.concurrency.record_overload(generation)
+                            if attempts >= self.max_attempts:
+                                raise
+                        elif _is_transient(error):
+                            transient_failures += 1
+                            if transient_failures >= self.max_transient_attempts:
+                                raise
+                        else:
+                            raise
+                    except ReadTimeoutError:
+                        self.concurrency.record_overload(generation)
+                        raise
+                    except TRANSIENT_EXCEPTIONS as error:
+                        if isinstance(error, ConnectTimeoutError):
+                            self.concurrency.record_overload(generation)
+                        transient_failures += 1
+                        if transient_failures >= self.max_transient_attempts:
+                            raise
+                    finally:
+                        self.concurrency.release()
+                    self._sleep(self._backoff(attempts - 1))
+
+                result = json.loads(response["Payload"].read().decode("utf-8"))
+                if response.get("FunctionError"):
+                    message = (
+                        result.get("errorMessage") if isinstance(result, dict) else None
+                    )
+                    raise RuntimeError(f"{function_name} failed: {message or result}")
+                ok = True
+                return result
+            finally:
+                self.metrics.record(
+                    function_name,
+                    time.perf_counter() - start,
+                    attempts,
+                    ok,
+                    self.concurrency.limit,
+                )
+                counts["attempts"] = attempts
+                counts["ok"] = ok
+
+
+def _local_client():
+    # pylint: disable=import-outside-toplevel
+    from local_lambda import LocalLambdaClient
+
+    return LocalLambdaClient()
+
+
+LAMBDA_GATEWAY = LambdaGateway(
+    client_factory=_local_client if os.environ.get("F2F_LOCAL_LAMBDA") else None
+)
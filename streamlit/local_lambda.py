@@ -0,0 +1,104 @@
+"""
+A local stand-in for the PDF Lambdas, for running the app and its
+dispatch code without AWS
+
+Set F2F_LOCAL_LAMBDA=1 to make the shared gateway use it. The stand-in
+renders nothing; it returns the links the real functions would.
+"""
+
+import io
+import json
+import threading
+import time
+from typing import Callable, Optional
+
+LOCAL_BUCKET_URL = "https://farm-to-fork-pdfs.s3.eu-west-2.amazonaws.com"
+
+
+def _links(documents: list[dict], name: Callable[[dict], str], kind: str) -> dict:
+    return {
+        name(document): f"{LOCAL_BUCKET_URL}/{name(document)} {kind}.pdf"
+        for document in documents
+    }
+
+
+def create_orders(event: dict) -> dict:
+    """Stand-in for the delivery notes function"""
+    return {
+        "links": _links(
+            event["orders"], lambda note: note["buyer"]["name"], "Delivery Note"
+        )
+    }
+
+
+def create_invoices(event: dict) -> dict:
+    """Stand-in for the invoices function"""
+    return {
+        "links": _links(
+            event["invoices"], lambda invoice: invoice["buyer"]["name"], "Invoice"
+        )
+    }
+
+
+def create_picks(event: dict) -> dict:
+    """Stand-in for the pick lists function"""
+    return {
+        "links": _links(
+            event["picks"], lambda pick: pick["seller"]["name"], "Pick List"
+        )
+    }
+
+
+def fetch(link: str) -> bytes:
+    """Stand-in for downloading a generated document"""
+    return f"%PDF-1.4\n% Local stand-in for {link}\n".encode("utf-8")
+
+
+HANDLERS = {
+    "create_orders": create_orders,
+    "create_invoices": create_invoices,
+    "create_picks": create_picks,
+}
+
+
+class LocalLambdaClient:
+    """
+    Answers boto3 Lambda invoke calls with local handlers, keyed by the
+    function name at the end of the ARN
+
+    Each invoke waits latency seconds plus latency_per_document for each
+    document in the payload, to stand in for rendering time.
+    """
+
+    def __init__(
+        self,
+        handlers: Optional[dict[str, Callable[[dict], dict]]] = None,
+        latency: float = 0.0,
+        latency_per_document: float = 0.0,
+    ):
+        self.handlers = HANDLERS if handlers is None else handlers
+        self.latency = latency
+        self.latency_per_document = latency_per_document
+        self.calls: list[tuple[str, dict]] = []
+        self._lock = threading.Lock()
+
+    def _handle(self, function_name: str, event: dict) -> dict:
+        documents = sum(
+            len(value) for value in event.values() if isinstance(value, list)
+        )
+        time.sleep(self.latency + self.latency_per_document * documents)
+        with self._lock:
+            self.calls.append((function_name, event))
+        return self.handlers[function_name](event)
+
+    def invoke(  # pylint: disable=invalid-name
+        self,
+        FunctionName: str,
+        Payload,
+        **_,
+    ) -> dict:
+        """Runs the handler synchronously"""
+        function_name = FunctionName.rsplit(":", 1)[-1]
+        event = json.loads(Payload)
+        result = self._handle(function_name, event)
+        return {"StatusCode": 200, "Payload": io.BytesIO(json.dumps(result).encode())}
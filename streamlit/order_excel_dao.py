@@ -1,5 +1,14 @@
+import io
+import multiprocessing
+import os
 import re
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
 from datetime import datetime
+from typing import Iterable, Iterator, Optional
 import openpyxl.workbook
 import openpyxl.worksheet
 import openpyxl.worksheet.worksheet
@@ -8,14 +17,90 @@ import numpy as np
 from domain import (
     ValidationError,
     Buyer,
+    BuyerDirectory,
     ValidationReport,
     Order,
     Seller,
     MarketPlace,
     MarketPlaceImport,
 )
+from instrumentation import span
+from order_table import OrderTable, encode_column
 import streamlit as st
 
+# Bump whenever the parsers produce different output for the same file, so
+# cached parse results from older versions are not reused
+PARSER_VERSION = 5
+
+
+# Spawned workers re-import the app's modules, which costs several sheets'
+# worth of parsing, so fewer sheets than this are parsed in-process
+MIN_FILES_PER_POOL = 4
+
+_pool_lock = threading.Lock()
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+
+
+def available_cpus() -> int:
+    """
+    The CPUs this process may use, honouring its affinity and any cgroup
+    CPU quota, such as a Fargate task's
+    """
+    cpus = len(os.sched_getaffinity(0))
+    quota = None
+    try:
+        with open("/sys/fs/cgroup/cpu.max", encoding="ascii") as cpu_max:
+            limit, period = cpu_max.read().split()
+        if limit != "max":
+            quota = int(limit) / int(period)
+    except (OSError, ValueError):
+        try:
+            with open(
+                "/sys/fs/cgroup/cpu/cpu.cfs_quota_us", encoding="ascii"
+            ) as quota_file:
+                limit = int(quota_file.read())
+            with open(
+                "/sys/fs/cgroup/cpu/cpu.cfs_period_us", encoding="ascii"
+            ) as period_file:
+                period = int(period_file.read())
+            if limit > 0:
+                quota = limit / period
+        except (OSError, ValueError):
+            pass
+    if quota is not None:
+        cpus = min(cpus, int(quota))
+    return max(1, cpus)
+
+
+def _process_pool(max_workers: int) -> ProcessPoolExecutor:
+    """
+    The shared parsing pool, so workers are spawned once rather than on
+    every parse, replaced only if a different size is asked for
+    """
+    global _pool, _pool_workers  # pylint: disable=global-statement
+    with _pool_lock:
+        if _pool is None or _pool_workers != max_workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # Spawn rather than fork, the Streamlit server process is
+            # multi-threaded
+            _pool = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            _pool_workers = max_workers
+        return _pool
+
+
+def _discard_pool(executor: ProcessPoolExecutor):
+    """Drops the shared pool after a worker died, so the next parse respawns it"""
+    global _pool  # pylint: disable=global-statement
+    with _pool_lock:
+        if _pool is executor:
+            _pool = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
 
 class ExcelCoords:
     row: int
@@ -31,57 +116,148 @@ class ExcelCoords:
         return f"{col_letter}{self.row}"
 
 
+# Sellers and repeated cell strings are shared between every order (and every
+# week) that uses them, rather than copied per order line
+_interned_sellers: dict[str, Seller] = {}
+
+
+def _intern(value):
+    """Interns string cell values, leaving other values as they are"""
+    if isinstance(value, str):
+        return sys.intern(value)
+    return value
+
+
+def _intern_seller(name: str) -> Seller:
+    """Returns the shared Seller with this name"""
+    seller = _interned_sellers.get(name)
+    if seller is None:
+        seller = _interned_sellers.setdefault(name, Seller(sys.intern(name)))
+    return seller
+
+
+class NamedBytesIO(io.BytesIO):
+    """In-memory copy of an uploaded file that keeps its name"""
+
+    def __init__(self, name: str, data: bytes):
+        super().__init__(data)
+        self.name = name
+
+
+@dataclass
+class ParseContext:
+    """
+    State of a single parse call. Parsers hold no per-file state, so one
+    parser can be shared by concurrent parse calls.
+    """
+
+    source: str
+    validation_errors: list[ValidationError] = field(default_factory=list)
+    rows_scanned: int = 0
+
+    def validation_report(self) -> ValidationReport:
+        """Builds the validation report for this parse"""
+        return ValidationReport(
+            source=self.source,
+            errors=list(self.validation_errors),
+            rows_scanned=self.rows_scanned,
+        )
+
+
 # def load(file_path: str) -> MarketPlaceImport:
 
 
 class ExcelParser:
     """Parse an excel file"""
 
-    validation_errors: list[ValidationError] = []
+    def _get_worksheet(
+        self,
+        workbook: openpyxl.Workbook,
+        worksheet_name: str,
+        context: ParseContext,
+    ):
+        """Gets the worksheet from the workbook, recording an error if missing"""
+        try:
+            return workbook[worksheet_name]
+        except KeyError:
+            st.error(f"Expected {worksheet_name} worksheet, but it does not exist.")
+            context.validation_errors.append(
+                ValidationError(
+                    f"Expected {worksheet_name} worksheet, but it does not exist."
+                )
+            )
+            raise KeyError(
+                f"Expected {worksheet_name} worksheet, but it does not exist."
+            )
 
     def _load_worksheet_from_excel(
-        self, excel_file, worksheet_name: str
+        self, excel_file, worksheet_name: str, context: ParseContext
     ) -> openpyxl.worksheet.worksheet:
         """Gets the worksheet from the workbook
 
         Args:
             excel_file (UploadedFile): The uploaded file
             sheet_name (str): Name of sheet to get from workbook
+            context (ParseContext): State of the current parse
 
         Returns:
             Worksheet: The worksheet
         """
         workbook = openpyxl.load_workbook(excel_file, data_only=True)
-        try:
-            worksheet = workbook[worksheet_name]
-        except KeyError:
-            st.error("Expected GROWERS' PAGE worksheet, but it does not exist.")
-            self.validation_errors.append(
-                ValidationError(
-                    f"Expected {worksheet_name} worksheet, but it does not exist."
-                )
-            )
-            raise KeyError(
-                f"Expected {worksheet_name} worksheet, but it does not exist."
-            )
-        return worksheet
+        return self._get_worksheet(workbook, worksheet_name, context)
+
+    def _stream_rows_from_excel(
+        self,
+        excel_file,
+        worksheet_name: str,
+        context: ParseContext,
+        min_row: int = 1,
+    ) -> Iterator[tuple]:
+        """Streams the row values of one worksheet in read-only mode
+
+        Only the requested worksheet is read, and rows are yielded as they are
+        decoded instead of building the in-memory cell model of the whole
+        workbook. The sheet's stored dimensions are ignored, as some tools
+        write a stale or missing one, so rows are padded to the width of the
+        first row instead.
+
+        Args:
+            excel_file (UploadedFile): The uploaded file
+            worksheet_name (str): Name of sheet to read from the workbook
+            context (ParseContext): State of the current parse
+            min_row (int): First row to yield (1-based)
 
-    def _date_extractor(self, file_name: str) -> datetime:
+        Yields:
+            tuple: The cell values of each row
+        """
+        workbook = openpyxl.load_workbook(excel_file, read_only=True, data_only=True)
+        try:
+            worksheet = self._get_worksheet(workbook, worksheet_name, context)
+            worksheet.reset_dimensions()
+            width = None
+            for row in worksheet.iter_rows(min_row=min_row, values_only=True):
+                row = tuple(row)
+                if width is None:
+                    width = len(row)
+                elif len(row) < width:
+                    row += (None,) * (width - len(row))
+                yield row
+        finally:
+            workbook.close()
+
+    def _date_extractor(self, file_name: str, context: ParseContext) -> datetime:
         try:
             order_sheet_name = str(file_name)
             date_str = order_sheet_name.split(" - ")[-1].split(".")[0]
             dateobj = datetime.strptime(date_str, "%d_%m_%Y")
             return dateobj
         except ValueError:
-            self.validation_errors.append(
+            context.validation_errors.append(
                 ValidationError(
                     f"Failed to extract date from order sheet: {file_name}, make sure the file name is in the format '...N - dd_mm_yyyy.xlsx"
                 )
             )
 
-    def _reset_errors(self):
-        self.validation_errors = []
-
 
 class OrderExcelParser(ExcelParser):
     """
@@ -89,35 +265,39 @@ class OrderExcelParser(ExcelParser):
     """
 
     buyers: list[Buyer]
+    buyer_directory: BuyerDirectory
     _header_row = 3
+    # The order table has gaps of over a hundred empty rows between growers,
+    # so only a much longer run of empty rows marks the end of the table.
+    _end_of_table_blank_rows = 500
     VAT_RATE = 0.0
 
-    def __init__(self, buyers: list[Buyer]):
+    def __init__(self, buyers: list[Buyer] | BuyerDirectory):
         self.buyers = buyers
+        if isinstance(buyers, BuyerDirectory):
+            self.buyer_directory = buyers
+        else:
+            self.buyer_directory = BuyerDirectory(buyers)
 
     def _find_buyer(self, name: str) -> Buyer:
-        for buyer in self.buyers:
-            if buyer.key == name:
-                return buyer
-        return None
+        return self.buyer_directory.find(name)
 
     def _parse_order_headers(
         self,
-        order_sheet: openpyxl.worksheet.worksheet.Worksheet,
+        headers: list,
+        context: ParseContext,
     ) -> tuple[dict[str, int], dict[int, Buyer]]:
         """Parse the headers of the order sheet
 
         Args:
-            headers (list): The headers of the order sheet
+            headers (list): The header row values of the order sheet
+            context (ParseContext): State of the current parse
 
         Returns:
             tuple[dict[str, int], dict[int, str]]: A tuple containing the header
             dictionary and the buyer keys
         """
 
-        headers = order_sheet[self._header_row]
-        headers = [cell.value for cell in headers]
-
         column_mapping = {
             "Produce Name": "produce",
             "Additional Info": "variant",
@@ -140,7 +320,7 @@ class OrderExcelParser(ExcelParser):
                 index_of_header = headers.index(key)
 
             except ValueError:
-                self.validation_errors.append(
+                context.validation_errors.append(
                     ValidationError(f"Header {key} could not be found in the sheet.")
                 )
 
@@ -150,13 +330,11 @@ class OrderExcelParser(ExcelParser):
         i = buyer_index + 1
         end = len(headers)
 
-        contact_list = [buyer.key for buyer in self.buyers]
-
         for i in range(i, end):
             current_buyer = headers[i]
 
             if i > 100:
-                self.validation_errors.append(
+                context.validation_errors.append(
                     ValidationError(
                         """It looks like there were lots of buyers, check
                     that any headers without buyers are empty"""
@@ -168,20 +346,22 @@ class OrderExcelParser(ExcelParser):
 
             current_buyer = str(current_buyer).strip()
 
-            if current_buyer not in contact_list:
-                self.validation_errors.append(
+            current_buyer_object = self._find_buyer(current_buyer)
+
+            if current_buyer_object is None:
+                context.validation_errors.append(
                     ValidationError(
                         f"Buyer {current_buyer} not found in contacts sheet."
                     )
                 )
 
-            current_buyer_object = self._find_buyer(current_buyer)
-
             buyer_keys[i] = current_buyer_object
 
         return header_dict, buyer_keys
 
-    def _parse_quantity(self, quantity: str, coords: ExcelCoords) -> float:
+    def _parse_quantity(
+        self, quantity: str, coords: ExcelCoords, context: ParseContext
+    ) -> float:
         """Parses the quantity from the row
 
         Args:
@@ -196,13 +376,15 @@ class OrderExcelParser(ExcelParser):
         try:
             float_quantity = float(cleaned)
         except ValueError:
-            self.validation_errors.append(
+            context.validation_errors.append(
                 ValidationError(f"Quantity at {coords} could not be parsed.")
             )
 
         return float_quantity
 
-    def _parse_price(self, price: str, coords: ExcelCoords) -> int:
+    def _parse_price(
+        self, price: str, coords: ExcelCoords, context: ParseContext
+    ) -> int:
         """Parse the price from string using regex etc.
 
         Args:
@@ -216,7 +398,7 @@ class OrderExcelParser(ExcelParser):
         try:
             float_price = float(cleaned)
         except ValueError:
-            self.validation_errors.append(
+            context.validation_errors.append(
                 ValidationError(f"Price at {coords} could not be parsed.")
             )
             return 0
@@ -226,7 +408,7 @@ class OrderExcelParser(ExcelParser):
         try:
             return int(rounded)
         except ValueError:
-            self.validation_errors.append(
+            context.validation_errors.append(
                 ValidationError(
                     f"""Price could not be parsed at {coords},
                     check that it has only 2 decimal places."""
@@ -234,18 +416,106 @@ class OrderExcelParser(ExcelParser):
             )
             return 0
 
+    @staticmethod
+    def _bulk_parse_numbers(values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Converts an array of cell values to floats in bulk
+
+        Only non-negative int and float cells whose text form has no exponent
+        are converted here, as for those the regex clean-up in _parse_quantity
+        and _parse_price is a no-op. Every other cell (blank, text, negative,
+        nan, ...) is left for the per-cell parsers so the results and errors
+        stay identical.
+
+        Args:
+            values (np.ndarray): Object array of raw cell values
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The float values (0 where not
+            converted) and a mask of the cells that were converted
+        """
+        cell_types = np.frompyfunc(type, 1, 1)(values)
+        is_int = cell_types == int
+        numeric = is_int | (cell_types == float)
+
+        numbers = np.zeros(values.shape, dtype=np.float64)
+        numbers[numeric] = values[numeric].astype(np.float64)
+
+        with np.errstate(invalid="ignore"):
+            plain = (numbers < 1e16) & ((numbers == 0) | is_int | (numbers >= 1e-4))
+            converted = numeric & (numbers >= 0) & plain
+
+        numbers[~converted] = 0.0
+        return numbers, converted
+
+    def _bulk_parse_prices_and_quantities(
+        self,
+        priced_rows: list[tuple],
+        row_numbers: list[int],
+        price_column: int,
+        buyer_columns: list[int],
+        context: ParseContext,
+    ) -> tuple[list[int], np.ndarray]:
+        """Parses the price column and the buyer quantity matrix in bulk
+
+        Args:
+            priced_rows (list[tuple]): Rows that have a price
+            row_numbers (list[int]): Sheet row number of each priced row
+            price_column (int): Index of the price column
+            buyer_columns (list[int]): Indexes of the buyer columns
+            context (ParseContext): State of the current parse
+
+        Returns:
+            tuple[list[int], np.ndarray]: The price of each row in pence and
+            the (rows x buyers) quantity matrix
+        """
+        prices_cells = np.array(
+            [row[price_column] for row in priced_rows], dtype=object
+        )
+        quantity_cells = np.array(
+            [[row[column] for column in buyer_columns] for row in priced_rows],
+            dtype=object,
+        ).reshape(len(priced_rows), len(buyer_columns))
+
+        price_numbers, prices_converted = self._bulk_parse_numbers(prices_cells)
+        prices = np.round(price_numbers * 100, decimals=0).astype(np.int64).tolist()
+        quantities, quantities_converted = self._bulk_parse_numbers(quantity_cells)
+
+        # Fall back to the per-cell parsers, in sheet order, for everything else
+        unconverted_rows = set(np.flatnonzero(~prices_converted).tolist())
+        unconverted_cells: dict[int, list[int]] = {}
+        for r, c in np.argwhere(~quantities_converted).tolist():
+            unconverted_cells.setdefault(r, []).append(c)
+            unconverted_rows.add(r)
+
+        for r in sorted(unconverted_rows):
+            if not prices_converted[r]:
+                prices[r] = self._parse_price(
+                    prices_cells[r],
+                    ExcelCoords(row=row_numbers[r], col=price_column),
+                    context,
+                )
+            for c in unconverted_cells.get(r, []):
+                quantities[r, c] = self._parse_quantity(
+                    quantity_cells[r, c],
+                    ExcelCoords(row=row_numbers[r], col=buyer_columns[c]),
+                    context,
+                )
+
+        return prices, quantities
+
     def _parse_orders(
         self,
-        order_sheet: openpyxl.worksheet.worksheet.Worksheet,
+        rows: Iterable[tuple],
         headers_dict: dict[str, int],
         buyers: dict[int, Buyer],
         delivery_date: str,
         name: str,
+        context: ParseContext,
     ) -> list[Order]:
         """_summary_
 
         Args:
-            order_sheet (openpyxl.worksheet.worksheet.Worksheet): _description_
+            rows (Iterable[tuple]): Row values below the header row
             headers_dict (dict[str, int]): _description_
             buyers (dict[int, str]): _description_
             delivery_date (str): _description_
@@ -255,59 +525,85 @@ class OrderExcelParser(ExcelParser):
         """
         i = self._header_row
 
-        orders: list[Order] = []
+        priced_rows: list[tuple] = []
+        row_numbers: list[int] = []
 
-        seller_set: set[Seller] = set()
+        blank_rows = 0
 
-        for row in order_sheet.iter_rows(
-            min_row=self._header_row + 1, values_only=True
-        ):
+        for row in rows:
             i += 1
 
             if row[headers_dict["price"]] is None or row[headers_dict["price"]] == "":
+                produce_cell = row[headers_dict["produce"]]
+                if produce_cell is None or produce_cell == "":
+                    blank_rows += 1
+                    if blank_rows >= self._end_of_table_blank_rows:
+                        break
+                else:
+                    blank_rows = 0
                 continue
 
-            price = self._parse_price(
-                row[headers_dict["price"]],
-                ExcelCoords(row=i, col=headers_dict["price"]),
+            blank_rows = 0
+
+            priced_rows.append(row)
+            row_numbers.append(i)
+
+        context.rows_scanned = i - self._header_row
+
+        buyer_columns = list(buyers)
+        prices, quantities = self._bulk_parse_prices_and_quantities(
+            priced_rows, row_numbers, headers_dict["price"], buyer_columns, context
+        )
+
+        order_rows, order_columns = np.nonzero(quantities)
+        rows_with_orders = np.unique(order_rows)
+
+        row_values: dict[str, list] = {
+            "seller": [],
+            "produce": [],
+            "variant": [],
+            "unit": [],
+        }
+        for r in rows_with_orders.tolist():
+            row = priced_rows[r]
+            row_values["seller"].append(
+                _intern_seller(str(row[headers_dict["seller"]]).strip())
             )
+            row_values["produce"].append(_intern(row[headers_dict["produce"]]))
+            row_values["variant"].append(_intern(row[headers_dict["variant"]]))
+            row_values["unit"].append(_intern(row[headers_dict["unit"]]))
 
-            for index, buyer in buyers.items():
-                quantity = self._parse_quantity(
-                    row[index], ExcelCoords(row=i, col=index)
-                )
+        columns: dict[str, np.ndarray] = {}
+        dictionaries: dict[str, tuple] = {}
 
-                if quantity == 0:
-                    continue
-
-                seller_name = str(row[headers_dict["seller"]]).strip()
-                produce = row[headers_dict["produce"]]
-                variant = row[headers_dict["variant"]]
-                unit = row[headers_dict["unit"]]
-                vat_rate = self.VAT_RATE
-
-                orders.append(
-                    Order(
-                        produce=produce,
-                        variant=variant,
-                        unit=unit,
-                        seller=Seller(seller_name),
-                        buyer=buyer,
-                        price=price,
-                        quantity=quantity,
-                        vat_rate=vat_rate,
-                        delivery_date=delivery_date,
-                    )
-                )
+        row_positions = np.searchsorted(rows_with_orders, order_rows)
+        for column_name, values in row_values.items():
+            codes, dictionaries[column_name] = encode_column(values)
+            columns[column_name] = codes[row_positions]
 
-                seller_set.add(Seller(seller_name))
+        buyer_codes, dictionaries["buyer"] = encode_column(
+            buyers[column] for column in buyer_columns
+        )
+        columns["buyer"] = buyer_codes[order_columns]
+
+        order_count = len(order_rows)
+        columns["delivery_date"] = np.zeros(order_count, dtype=np.int32)
+        dictionaries["delivery_date"] = (delivery_date,)
+        columns["source"] = np.zeros(order_count, dtype=np.int32)
+        dictionaries["source"] = (name,)
+
+        columns["price"] = np.array(prices, dtype=np.int64)[order_rows]
+        columns["quantity"] = quantities[order_rows, order_columns]
+        columns["vat_rate"] = np.full(order_count, self.VAT_RATE, dtype=np.float64)
+        columns["row"] = np.array(row_numbers, dtype=np.int64)[order_rows]
+        columns["column"] = np.array(buyer_columns, dtype=np.int64)[order_columns]
 
         week_number = self._parse_week(name)
 
         market_place = MarketPlace(
-            sellers=frozenset(seller_set),
+            sellers=frozenset(row_values["seller"]),
             buyers=frozenset(self.buyers),
-            orders=frozenset(orders),
+            table=OrderTable(columns, dictionaries),
             week=week_number,
         )
 
@@ -334,18 +630,84 @@ class OrderExcelParser(ExcelParser):
         """
         Parses order data from the spreadsheet to a clean domain
         """
-        # Reset errors
-        self._reset_errors()
-        order_sheet = self._load_worksheet_from_excel(file, "GROWERS' PAGE")
-        headers_dict, buyers = self._parse_order_headers(order_sheet)
-        if use_file_name_for_date:
-            delivery_date = self._date_extractor(file.name)
-        market_place = self._parse_orders(
-            order_sheet, headers_dict, buyers, delivery_date, file.name
-        )
-        validation_report = ValidationReport(
-            source=file.name, errors=self.validation_errors
-        )
+        context = ParseContext(source=file.name)
+        with span("parse_orders", source=file.name) as counts:
+            rows = self._stream_rows_from_excel(
+                file, "GROWERS' PAGE", context, min_row=self._header_row
+            )
+            try:
+                headers = list(next(rows, ()))
+                headers_dict, buyers = self._parse_order_headers(headers, context)
+                if use_file_name_for_date:
+                    delivery_date = self._date_extractor(file.name, context)
+                market_place = self._parse_orders(
+                    rows, headers_dict, buyers, delivery_date, file.name, context
+                )
+            finally:
+                rows.close()
+            counts["rows"] = context.rows_scanned
+            counts["orders"] = len(market_place.table)
         return MarketPlaceImport(
-            market_place=market_place, validation_report=validation_report
+            market_place=market_place, validation_report=context.validation_report()
         )
+
+    def parse_many(
+        self,
+        files: list,
+        delivery_date=None,
+        use_file_name_for_date=False,
+        max_workers: Optional[int] = None,
+    ) -> list[MarketPlaceImport]:
+        """
+        Parses several order sheets across a process pool
+
+        The imports are returned in the same order as the files. max_workers
+        defaults to the CPUs available to this process. With fewer than
+        MIN_FILES_PER_POOL files, or one worker, the sheets are parsed in this
+        process instead, as spawning workers costs more than it saves.
+        """
+        if max_workers is None:
+            max_workers = available_cpus()
+        max_workers = max(1, min(max_workers, len(files)))
+        if len(files) < MIN_FILES_PER_POOL:
+            max_workers = 1
+
+        with span("parse_many", files=len(files), workers=max_workers) as counts:
+            if max_workers == 1:
+                imports = [
+                    self.parse(file, delivery_date, use_file_name_for_date)
+                    for file in files
+                ]
+            else:
+                executor = _process_pool(max_workers)
+                futures = [
+                    executor.submit(
+                        _parse_order_sheet,
+                        self.buyers,
+                        NamedBytesIO(file.name, file.getvalue()),
+                        delivery_date,
+                        use_file_name_for_date,
+                    )
+                    for file in files
+                ]
+                try:
+                    imports = [future.result() for future in futures]
+                except BrokenProcessPool:
+                    _discard_pool(executor)
+                    raise
+            counts["rows"] = sum(
+                market_place_import.validation_report.rows_scanned
+                for market_place_import in imports
+            )
+            counts["orders"] = sum(
+                len(market_place_import.market_place.table)
+                for market_place_import in imports
+            )
+        return imports
+
+
+def _parse_order_sheet(
+    buyers: list[Buyer], file, delivery_date, use_file_name_for_date
+) -> MarketPlaceImport:
+    """Parses one order sheet in a worker process"""
+    return OrderExcelParser(buyers).parse(file, delivery_date, use_file_name_for_date)
@@ -0,0 +1,326 @@
+"""
+Local SQLite store of parsed weekly orders, so reports over many weeks can be
+built without re-parsing the spreadsheets
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import date
+from typing import Iterator, Optional
+import numpy as np
+from domain import Buyer, MarketPlace, Seller
+from instrumentation import span
+from order_table import OrderTable, encode_column
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buyers (
+    key TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    address_line_1 TEXT NOT NULL,
+    address_line_2 TEXT,
+    city TEXT NOT NULL,
+    postcode TEXT NOT NULL,
+    country TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS market_places (
+    week INTEGER NOT NULL,
+    delivery_date TEXT NOT NULL,
+    source TEXT,
+    PRIMARY KEY (week, delivery_date)
+);
+CREATE TABLE IF NOT EXISTS orders (
+    week INTEGER NOT NULL,
+    delivery_date TEXT NOT NULL,
+    source TEXT,
+    sheet_row INTEGER,
+    sheet_column INTEGER,
+    buyer_key TEXT,
+    seller TEXT NOT NULL,
+    produce TEXT,
+    variant TEXT,
+    unit TEXT,
+    price INTEGER NOT NULL,
+    quantity REAL NOT NULL,
+    vat_rate REAL NOT NULL,
+    FOREIGN KEY (week, delivery_date)
+        REFERENCES market_places (week, delivery_date) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS orders_week ON orders (week, delivery_date);
+CREATE INDEX IF NOT EXISTS orders_delivery_date ON orders (delivery_date);
+CREATE INDEX IF NOT EXISTS orders_buyer ON orders (buyer_key, delivery_date);
+CREATE INDEX IF NOT EXISTS orders_seller ON orders (seller, delivery_date);
+"""
+
+
+class OrderStore:
+    """
+    Stores each week's market place once, keyed by week and delivery date,
+    and loads market places back for a range of delivery dates
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        with closing(self._connect()) as connection:
+            connection.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path)
+        connection.execute("PRAGMA foreign_keys = ON")
+        return connection
+
+    def ingest(self, market_place: MarketPlace):
+        """
+        Saves a market place, replacing any already stored for its week and
+        delivery date
+        """
+        table = market_place.table
+        delivery_dates = [day for day in table.dictionaries["delivery_date"] if day]
+        if len(set(delivery_dates)) > 1:
+            raise ValueError("A market place must have a single delivery date.")
+        if not delivery_dates:
+            raise ValueError("Orders without a delivery date cannot be stored.")
+        delivery_date = delivery_dates[0].strftime("%Y-%m-%d")
+        week = int(market_place.week)
+        source = next(iter(table.dictionaries["source"]), None)
+
+        buyers = [
+            (
+                buyer.key,
+                buyer.name,
+                buyer.address_line_1,
+                buyer.address_line_2,
+                buyer.city,
+                buyer.postcode,
+                buyer.country,
+            )
+            for buyer in market_place.buyers
+        ]
+
+        def decoded(name: str, value=lambda value: value) -> list:
+            dictionary = [value(item) for item in table.dictionaries[name]]
+            return [dictionary[code] for code in table.columns[name].tolist()]
+
+        rows = zip(
+            decoded("source"),
+            [None if row < 0 else row for row in table.columns["row"].tolist()],
+            [None if col < 0 else col for col in table.columns["column"].tolist()],
+            decoded("buyer", lambda buyer: None if buyer is None else buyer.key),
+            decoded("seller", lambda seller: seller.name),
+            decoded("produce"),
+            decoded("variant"),
+            decoded("unit"),
+            table.columns["price"].tolist(),
+            table.columns["quantity"].tolist(),
+            table.columns["vat_rate"].tolist(),
+        )
+
+        with self._lock, closing(self._connect()) as connection, connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO buyers VALUES (?, ?, ?, ?, ?, ?, ?)", buyers
+            )
+            connection.execute(
+                "DELETE FROM market_places WHERE week = ? AND delivery_date = ?",
+                (week, delivery_date),
+            )
+            connection.execute(
+                "INSERT INTO market_places VALUES (?, ?, ?)",
+                (week, delivery_date, source),
+            )
+            connection.executemany(
+                "INSERT INTO orders VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                ((week, delivery_date, *row) for row in rows),
+            )
+
+    def ingest_many(self, market_places: list[MarketPlace]):
+        """
+        Saves several market places
+        """
+        for market_place in market_places:
+            self.ingest(market_place)
+
+    def weeks(
+        self, start: Optional[date] = None, end: Optional[date] = None
+    ) -> list[tuple[int, date]]:
+        """
+        The week number and delivery date of every stored market place,
+        optionally only those delivered between start and end (inclusive)
+        """
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                "SELECT week, delivery_date FROM market_places"
+                " WHERE delivery_date BETWEEN ? AND ? ORDER BY delivery_date",
+                (
+                    (start or date.min).isoformat(),
+                    (end or date.max).isoformat(),
+                ),
+            ).fetchall()
+        return [(week, date.fromisoformat(day)) for week, day in rows]
+
+    def market_places(
+        self,
+        start: date,
+        end: date,
+        buyer_key: Optional[str] = None,
+        seller: Optional[str] = None,
+    ) -> "StoredMarketPlaces":
+        """
+        The market places delivered between start and end (inclusive),
+        optionally only with the orders of one buyer or one seller
+
+        Nothing is loaded until they are iterated, and each iteration loads
+        them again one week at a time.
+        """
+        return StoredMarketPlaces(self, start, end, buyer_key, seller)
+
+    def iter_market_places(
+        self,
+        start: date,
+        end: date,
+        buyer_key: Optional[str] = None,
+        seller: Optional[str] = None,
+    ) -> Iterator[MarketPlace]:
+        """
+        Yields the market places delivered between start and end (inclusive)
+        one week at a time, so only one week's rows are loaded at once
+        """
+        query = (
+            "SELECT week, delivery_date, source, sheet_row, sheet_column,"
+            " buyer_key, seller, produce, variant, unit, price, quantity, vat_rate"
+            " FROM orders WHERE week = ? AND delivery_date = ?"
+        )
+        parameters: list = []
+        if buyer_key is not None:
+            query += " AND buyer_key = ?"
+            parameters.append(buyer_key)
+        if seller is not None:
+            query += " AND seller = ?"
+            parameters.append(seller)
+        query += " ORDER BY sheet_row, sheet_column"
+
+        with closing(self._connect()) as connection:
+            buyers = {
+                row[0]: Buyer(
+                    key=row[0],
+                    name=row[1],
+                    address_line_1=row[2],
+                    address_line_2=row[3],
+                    city=row[4],
+                    postcode=row[5],
+                    country=row[6],
+                )
+                for row in connection.execute(
+                    "SELECT key, name, address_line_1, address_line_2, city,"
+                    " postcode, country FROM buyers"
+                )
+            }
+            weeks = connection.execute(
+                "SELECT week, delivery_date FROM market_places"
+                " WHERE delivery_date BETWEEN ? AND ? ORDER BY delivery_date, week",
+                (start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")),
+            ).fetchall()
+
+            for week, day in weeks:
+                with span("load_week", week=week, delivery_date=day) as counts:
+                    rows = connection.execute(
+                        query, [week, day, *parameters]
+                    ).fetchall()
+                    market_place = self._market_place(
+                        week, date.fromisoformat(day), rows, buyers
+                    )
+                    counts["orders"] = len(rows)
+                yield market_place
+
+    @staticmethod
+    def _market_place(
+        week: int, delivery_date: date, rows: list[tuple], buyers: dict[str, Buyer]
+    ) -> MarketPlace:
+        """Builds a market place's order table straight from the stored rows"""
+        (
+            _,
+            _,
+            sources,
+            row_numbers,
+            column_numbers,
+            buyer_keys,
+            seller_names,
+            produce,
+            variants,
+            units,
+            prices,
+            quantities,
+            vat_rates,
+        ) = zip(*rows) if rows else ((),) * 13
+
+        sellers = {name: Seller(name) for name in set(seller_names)}
+
+        columns: dict[str, np.ndarray] = {}
+        dictionaries: dict[str, tuple] = {}
+        for name, values in (
+            ("buyer", (buyers.get(key) for key in buyer_keys)),
+            ("seller", (sellers[name] for name in seller_names)),
+            ("produce", produce),
+            ("variant", variants),
+            ("unit", units),
+            ("source", sources),
+        ):
+            columns[name], dictionaries[name] = encode_column(values)
+
+        columns["delivery_date"] = np.zeros(len(rows), dtype=np.int32)
+        dictionaries["delivery_date"] = (delivery_date,)
+        columns["price"] = np.array(prices, dtype=np.int64)
+        columns["quantity"] = np.array(quantities, dtype=np.float64)
+        columns["vat_rate"] = np.array(vat_rates, dtype=np.float64)
+        columns["row"] = np.array(
+            [-1 if row is None else row for row in row_numbers], dtype=np.int64
+        )
+        columns["column"] = np.array(
+            [-1 if column is None else column for column in column_numbers],
+            dtype=np.int64,
+        )
+
+        return MarketPlace(
+            sellers=frozenset(sellers.values()),
+            buyers=frozenset(buyers.values()),
+            table=OrderTable(columns, dictionaries),
+            week=week,
+        )
+
+
+class StoredMarketPlaces:
+    """
+    The stored market places of a range of delivery dates, re-loaded one week
+    at a time whenever they are iterated
+    """
+
+    def __init__(
+        self,
+        store: OrderStore,
+        start: date,
+        end: date,
+        buyer_key: Optional[str] = None,
+        seller: Optional[str] = None,
+    ):
+        self.store = store
+        self.start = start
+        self.end = end
+        self.buyer_key = buyer_key
+        self.seller = seller
+
+    def __iter__(self) -> Iterator[MarketPlace]:
+        return self.store.iter_market_places(
+            self.start, self.end, self.buyer_key, self.seller
+        )
+
+
+# The store must live on persistent storage, such as a mounted volume. The
+# container's own disk is wiped on every deploy or Spot restart, and a
+# store-based invoice run would then silently leave out the lost weeks. With
+# no path configured there is no store.
+ORDER_STORE: Optional[OrderStore] = (
+    OrderStore(os.environ["F2F_ORDER_STORE"])
+    if os.environ.get("F2F_ORDER_STORE")
+    else None
+)
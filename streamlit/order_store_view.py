@@ -0,0 +1,49 @@
+"""
+Shows which stored weeks a run from the order store will use, before it runs
+"""
+
+from datetime import date, timedelta
+from order_store import ORDER_STORE
+import streamlit as st
+
+# Weekly deliveries further apart than this suggest a week is missing
+WEEK_GAP = timedelta(days=7)
+
+
+def render_stored_weeks(start: date, end: date) -> int:
+    """
+    Lists the stored weeks delivered between start and end, warning about any
+    gap of more than a week, and returns how many weeks there are
+    """
+    weeks = ORDER_STORE.weeks(start, end)
+    if not weeks:
+        st.warning("There are no stored orders in that period.")
+        return 0
+
+    st.markdown(
+        "Stored weeks in this period: "
+        + ", ".join(
+            f"week {week} ({delivery_date.strftime('%d/%m/%Y')})"
+            for week, delivery_date in weeks
+        )
+    )
+
+    delivery_dates = [start - timedelta(days=1)]
+    delivery_dates += [delivery_date for _, delivery_date in weeks]
+    delivery_dates.append(end + timedelta(days=1))
+    gaps = [
+        (after, before)
+        for after, before in zip(delivery_dates, delivery_dates[1:])
+        if before - after > WEEK_GAP
+    ]
+    if gaps:
+        st.warning(
+            "No orders are stored for deliveries "
+            + ", ".join(
+                f"after {after.strftime('%d/%m/%Y')} and before "
+                f"{before.strftime('%d/%m/%Y')}"
+                for after, before in gaps
+            )
+            + ". Upload those weeks' order sheets if they had deliveries."
+        )
+    return len(weeks)
@@ -3,74 +3,123 @@ Module to generate summaries to be downloaded by the user
 """
 
 from dataclasses import dataclass
-from domain import MarketPlace, Order, Seller
+from typing import Callable, Iterable
+import numpy as np
 import pandas as pd
+from domain import MarketPlace
+from instrumentation import span
+from order_table import OrderTable
 
 
 @dataclass(frozen=True)
-class SellerSummary:
+class OrderSummaries:
     """
-    Class to represent the summary of the orders for one seller
+    Class to hold the orders and the seller, buyer and produce summaries
+    built from them
     """
 
-    seller: Seller
-    total_sold: float
+    orders: pd.DataFrame
+    sellers: pd.DataFrame
+    buyers: pd.DataFrame
+    produce: pd.DataFrame
 
 
-def aggregate_orders(market_places: list[MarketPlace]) -> pd.DataFrame:
+def _decode(
+    table: OrderTable, name: str, value: Callable = lambda value: value
+) -> np.ndarray:
     """
-    Function that aggregates the orders
+    Decodes a dictionary-encoded column, converting each distinct value once
     """
-    all_orders: list[Order] = []
-    all_sellers: set[Seller] = set()
-
-    for market_place in market_places:
-        all_orders.extend(
-            {
-                "delivery_date": order.delivery_date.strftime("%Y-%m-%d"),
-                "seller": order.seller.name,
-                "buyer": order.buyer.name,
-                "produce": order.produce,
-                "additional info": order.variant,
-                "quantity": order.quantity,
-                "unit": order.unit,
-                "price": order.price / 100,
-                "total price": order.price / 100 * order.quantity,
-            }
-            for order in market_place.orders
-        )
-        all_sellers.update(market_place.sellers)
+    dictionary = np.empty(len(table.dictionaries[name]), dtype=object)
+    dictionary[:] = [value(item) for item in table.dictionaries[name]]
+    return dictionary[table.columns[name]]
+
 
-    # Save all_orders as a CSV file
-    all_orders_df = pd.DataFrame(all_orders, index=None)
+def _orders_frame(market_places: Iterable[MarketPlace]) -> pd.DataFrame:
+    """
+    Builds one DataFrame of every order, with money in integer pence
 
-    return all_orders_df
+    Each week is converted on its own, so market_places may be a generator
+    that loads one week at a time.
+    """
+    frames = [_table_frame(market_place.table) for market_place in market_places]
+    if not frames:
+        return _table_frame(OrderTable.empty())
+    return pd.concat(frames, ignore_index=True)
 
 
-def generate_seller_summaries(market_places: list[MarketPlace]) -> pd.DataFrame:
+def _table_frame(table: OrderTable) -> pd.DataFrame:
     """
-    Function that calculates the summary
+    Builds the DataFrame of one table's orders
     """
-    all_orders: list[Order] = []
-    all_sellers: set[Seller] = set()
+    price_pence = table.columns["price"]
+    total_pence = np.floor(price_pence * table.columns["quantity"] + 0.5)
+
+    return pd.DataFrame(
+        {
+            "delivery_date": _decode(
+                table, "delivery_date", lambda day: day.strftime("%Y-%m-%d")
+            ),
+            "seller": _decode(table, "seller", lambda seller: seller.name),
+            "buyer": _decode(table, "buyer", lambda buyer: buyer.name),
+            "produce": _decode(table, "produce"),
+            "additional info": _decode(table, "variant"),
+            "quantity": table.columns["quantity"],
+            "unit": _decode(table, "unit"),
+            "price_pence": price_pence,
+            "total_pence": total_pence.astype(np.int64),
+        }
+    )
+
+
+def generate_summaries(market_places: Iterable[MarketPlace]) -> OrderSummaries:
+    """
+    Function that builds the orders and all the summaries from one DataFrame
+    """
+    with span("summarise") as counts:
+        frame = _orders_frame(market_places)
 
-    for market_place in market_places:
-        all_orders.extend(market_place.orders)
-        all_sellers.update(market_place.sellers)
+        orders = frame.drop(columns=["price_pence", "total_pence"]).assign(
+            price=frame["price_pence"] / 100,
+            **{"total price": frame["total_pence"] / 100},
+        )
 
-    seller_summaries: list[SellerSummary] = []
+        sellers = (
+            frame.groupby("seller", sort=True)["total_pence"]
+            .sum()
+            .div(100)
+            .rename("total_sold")
+            .reset_index()
+        )
 
-    for seller in all_sellers:
-        total_sold = sum(
-            order.price * order.quantity
-            for order in all_orders
-            if order.seller == seller
+        buyers = (
+            frame.groupby("buyer", sort=True)["total_pence"]
+            .sum()
+            .div(100)
+            .rename("total_bought")
+            .reset_index()
         )
-        total_sold_export = total_sold / 100
-        seller_summary = SellerSummary(seller.name, total_sold_export)
-        seller_summaries.append(seller_summary)
 
-    # Convert seller_summaries to DataFrame
-    seller_summaries_df = pd.DataFrame(seller_summaries)
+        produce = (
+            frame.groupby(["produce", "unit"], sort=True, dropna=False)
+            .agg(quantity=("quantity", "sum"), total_pence=("total_pence", "sum"))
+            .reset_index()
+        )
+        produce["total_sold"] = produce.pop("total_pence") / 100
+        counts["rows"] = len(frame)
 
-    return seller_summaries_df
+    return OrderSummaries(orders=orders, sellers=sellers, buyers=buyers, produce=produce)
+
+
+def aggregate_orders(market_places: Iterable[MarketPlace]) -> pd.DataFrame:
+    """
+    Function that aggregates the orders
+    """
+    return generate_summaries(market_places).orders
+
+
+def generate_seller_summaries(market_places: Iterable[MarketPlace]) -> pd.DataFrame:
+    """
+    Function that calculates the summary
+    """
+    return generate_summaries(market_places).sellers
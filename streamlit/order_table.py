@@ -0,0 +1,153 @@
+"""
+Columnar storage for a set of orders
+"""
+
+from typing import Iterable
+import numpy as np
+from domain import Order
+
+
+def encode_column(values: Iterable) -> tuple[np.ndarray, tuple]:
+    """Dictionary-encodes values into integer codes and the distinct values"""
+    dictionary: dict = {}
+    codes = [dictionary.setdefault(value, len(dictionary)) for value in values]
+    return np.array(codes, dtype=np.int32), tuple(dictionary)
+
+
+def _merge_dictionaries(
+    dictionaries: list[tuple],
+) -> tuple[tuple, list[np.ndarray]]:
+    """Merges dictionaries, returning the merged one and a code map for each"""
+    merged: dict = {}
+    mappings = [
+        np.array(
+            [merged.setdefault(value, len(merged)) for value in dictionary],
+            dtype=np.int32,
+        )
+        for dictionary in dictionaries
+    ]
+    return tuple(merged), mappings
+
+
+class OrderTable:
+    """
+    Orders held as NumPy columns rather than one object per order.
+
+    Prices are integer pence. Buyers, sellers, produce, variants, units,
+    delivery dates and sources are dictionary-encoded: each is an int32 code
+    column indexing into a tuple of the distinct values.
+    """
+
+    CODED_COLUMNS = (
+        "buyer",
+        "seller",
+        "produce",
+        "variant",
+        "unit",
+        "delivery_date",
+        "source",
+    )
+    NUMERIC_COLUMNS = ("price", "quantity", "vat_rate", "row", "column")
+
+    def __init__(
+        self, columns: dict[str, np.ndarray], dictionaries: dict[str, tuple]
+    ):
+        self.columns = columns
+        self.dictionaries = dictionaries
+
+    @classmethod
+    def empty(cls) -> "OrderTable":
+        """A table with no orders"""
+        columns = {name: np.zeros(0, dtype=np.int32) for name in cls.CODED_COLUMNS}
+        columns.update(
+            price=np.zeros(0, dtype=np.int64),
+            quantity=np.zeros(0, dtype=np.float64),
+            vat_rate=np.zeros(0, dtype=np.float64),
+            row=np.zeros(0, dtype=np.int64),
+            column=np.zeros(0, dtype=np.int64),
+        )
+        return cls(columns, {name: () for name in cls.CODED_COLUMNS})
+
+    @classmethod
+    def concat(cls, tables: list["OrderTable"]) -> "OrderTable":
+        """Joins tables, re-encoding their dictionaries into shared ones"""
+        tables = [table for table in tables if len(table)]
+        if not tables:
+            return cls.empty()
+        if len(tables) == 1:
+            return tables[0]
+
+        columns = {}
+        dictionaries = {}
+        for name in cls.CODED_COLUMNS:
+            dictionaries[name], mappings = _merge_dictionaries(
+                [table.dictionaries[name] for table in tables]
+            )
+            columns[name] = np.concatenate(
+                [
+                    mapping[table.columns[name]]
+                    for mapping, table in zip(mappings, tables)
+                ]
+            )
+        for name in cls.NUMERIC_COLUMNS:
+            columns[name] = np.concatenate([table.columns[name] for table in tables])
+        return cls(columns, dictionaries)
+
+    def __len__(self) -> int:
+        return len(self.columns["price"])
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, OrderTable):
+            return NotImplemented
+        return (
+            len(self) == len(other)
+            and all(
+                np.array_equal(self.decode(name), other.decode(name))
+                for name in self.CODED_COLUMNS
+            )
+            and all(
+                np.array_equal(self.columns[name], other.columns[name])
+                for name in self.NUMERIC_COLUMNS
+            )
+        )
+
+    __hash__ = None
+
+    def decode(self, name: str) -> np.ndarray:
+        """The values of a dictionary-encoded column as an object array"""
+        dictionary = np.empty(len(self.dictionaries[name]), dtype=object)
+        dictionary[:] = self.dictionaries[name]
+        return dictionary[self.columns[name]]
+
+    def take(self, indices: np.ndarray) -> "OrderTable":
+        """A table of the orders at the given indices or boolean mask"""
+        return OrderTable(
+            {name: column[indices] for name, column in self.columns.items()},
+            self.dictionaries,
+        )
+
+    def to_orders(self) -> list[Order]:
+        """Materialises the table as order objects"""
+        decoded = {name: self.decode(name).tolist() for name in self.CODED_COLUMNS}
+        prices = self.columns["price"].tolist()
+        quantities = self.columns["quantity"].tolist()
+        vat_rates = self.columns["vat_rate"].tolist()
+        rows = self.columns["row"].tolist()
+        columns = self.columns["column"].tolist()
+        return [
+            Order(
+                produce=decoded["produce"][i],
+                unit=decoded["unit"][i],
+                seller=decoded["seller"][i],
+                buyer=decoded["buyer"][i],
+                variant=decoded["variant"][i],
+                price=prices[i],
+                quantity=quantities[i],
+                vat_rate=vat_rates[i],
+                delivery_date=decoded["delivery_date"][i],
+                source=decoded["source"][i],
+                row=None if rows[i] < 0 else rows[i],
+                column=None if columns[i] < 0 else columns[i],
+            )
+            for i in range(len(self))
+        ]
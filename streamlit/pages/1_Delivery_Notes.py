@@ -2,17 +2,26 @@
 Delivery Note page
 """
 
-import json
 import re
-import boto3
 from openpyxl.reader.excel import load_workbook
 from contacts_excel_dao import ContactsExcelParser
 from order_excel_dao import OrderExcelParser
+from parse_cache import PARSE_CACHE
 import streamlit as st
 from create_delivery_notes import create_delivery_notes
-from json_generators import generate_order_json
+from json_generators import delivery_notes_payload
+from pdf_dispatch import invoke_concurrently
+from pdf_jobs import JOB_MANAGER
+from document_cache import DOCUMENT_CACHE
+from pdf_zip import ZipAssembler
+from job_view import render_job
+from diagnostics_view import render_run_diagnostics, start_run_diagnostics
+from lambda_gateway import LAMBDA_GATEWAY, CREATE_ORDERS_FUNCTION
 
 
+DELIVERY_NOTES_JOB = "delivery_notes_job"
+DELIVERY_NOTES_DIAGNOSTICS = "delivery_notes_diagnostics"
+
 st.set_page_config(page_title="Delivery Notes Generator")
 
 HIDE_STREAMLIT_STYLE = """
@@ -32,7 +41,8 @@ INSTRUCTIONS = """
 3. Update the contacts spreadsheet with all contact info.
     Note:
     - Do not change the column titles
-    - The "Buyer Key as in Spreadsheet" entries must exactly match those in the order spreadsheet.
+    - The "Buyer Key as in Spreadsheet" entries must match those in the order spreadsheet.
+      Case and surrounding spaces are ignored, so no two keys may differ only by those.
 4. Upload the order spreadsheet and the contacts spreadsheet below.
 5. Delivery notes are automatically generated. Click to download.
 """
@@ -56,19 +66,31 @@ contacts = st.file_uploader(
     "Choose Contacts Excel", type="xlsx", accept_multiple_files=False
 )
 date = st.date_input("What's the delivery date?")
+run_in_background = st.toggle("Generate in the background (for large runs)")
+show_diagnostics = st.toggle("Show run diagnostics")
 
 # prepare order number parts
 
-if st.button("Generate Delivery Notes"):
+generate = st.button("Generate Delivery Notes")
+if not generate:
+    if show_diagnostics:
+        render_run_diagnostics(DELIVERY_NOTES_DIAGNOSTICS)
+    render_job(DELIVERY_NOTES_JOB, "Delivery Notes", "Download All Notes")
+
+if generate:
+    st.session_state.pop(DELIVERY_NOTES_JOB, None)
+    start_run_diagnostics(DELIVERY_NOTES_DIAGNOSTICS)
     if order_sheet_file and contacts and date:
         st.markdown("---")
 
         contacts_parser = ContactsExcelParser()
-        contacts_import = contacts_parser.parse(contacts)
+        contacts_import = PARSE_CACHE.parse_contacts(contacts, contacts_parser)
         contacts_import.validation_report.raise_error()
 
-        order_parser = OrderExcelParser(contacts_import.buyers)
-        market_place_import = order_parser.parse(order_sheet_file, date)
+        order_parser = OrderExcelParser(contacts_import.buyer_directory)
+        market_place_import = PARSE_CACHE.parse_orders(
+            order_parser, order_sheet_file, date
+        )
         market_place_import.validation_report.raise_error()
 
         week_number_match = re.search(r"k (\d+)", order_sheet_file.name)
@@ -83,40 +105,39 @@ if st.button("Generate Delivery Notes"):
             market_place_import.market_place, date, week_number
         )
 
-        delivery_notes_json_export = generate_order_json(delivery_notes)
-
-        Lambda = boto3.client("lambda", region_name="eu-west-2")
-        response = Lambda.invoke(
-            FunctionName="arn:aws:lambda:eu-west-2:850434255294:function:create_orders",
-            InvocationType="RequestResponse",
-            LogType="Tail",
-            Payload=delivery_notes_json_export,
-        )
-        result = json.loads(response["Payload"].read().decode("utf-8"))
+        if run_in_background:
+            st.session_state[DELIVERY_NOTES_JOB] = JOB_MANAGER.submit(
+                CREATE_ORDERS_FUNCTION,
+                delivery_notes_payload(delivery_notes),
+                "orders",
+                zip_name=f"{date.strftime('%Y-%m-%d')} Delivery Notes",
+            )
+            st.rerun()
 
+        zip_assembler = ZipAssembler()
         i = 0
-        links = []
-
-        for college, link in result["links"].items():
-            encoded_link = link.replace(" ", "%20")
-            links.append(link)
-            st.markdown(f"[{college} Delivery Notes]({encoded_link})")
-            i += 1
-
-        links_data = {
-            "links": links,
-            "name": f"{date.strftime('%Y-%m-%d')} Delivery Notes",
-        }
-        links_json = json.dumps(links_data)
-        zipped = Lambda.invoke(
-            FunctionName="arn:aws:lambda:eu-west-2:850434255294:function:zipper",
-            InvocationType="RequestResponse",
-            LogType="Tail",
-            Payload=links_json,
+
+        for chunk_links in invoke_concurrently(
+            LAMBDA_GATEWAY,
+            CREATE_ORDERS_FUNCTION,
+            delivery_notes_payload(delivery_notes),
+            "orders",
+            cache=DOCUMENT_CACHE,
+        ):
+            for college, link in chunk_links.items():
+                encoded_link = link.replace(" ", "%20")
+                st.markdown(f"[{college} Delivery Notes]({encoded_link})")
+                zip_assembler.add(link)
+                i += 1
+
+        st.download_button(
+            "Download All Notes",
+            zip_assembler.finish(),
+            file_name=f"{date.strftime('%Y-%m-%d')} Delivery Notes.zip",
+            mime="application/zip",
         )
-        zipped = json.loads(zipped["Payload"].read().decode("utf-8"))
-        encoded_link = zipped["zip"].replace(" ", "%20")
-        st.link_button("Download All Notes", encoded_link)
+        if show_diagnostics:
+            render_run_diagnostics(DELIVERY_NOTES_DIAGNOSTICS)
     else:
         st.warning(
             "Please upload weekly order spreadsheet and contacts spreadsheet and select a date."
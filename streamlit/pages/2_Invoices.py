@@ -1,10 +1,20 @@
-import json
+import datetime
 import re
-import boto3
 from create_invoices import create_invoices
 from contacts_excel_dao import ContactsExcelParser
 from order_excel_dao import OrderExcelParser
-from json_generators import generate_invoices_json
+from parse_cache import PARSE_CACHE
+from order_store import ORDER_STORE
+from order_store_view import render_stored_weeks
+from domain import ValidationReport
+from json_generators import invoices_payload
+from pdf_dispatch import invoke_concurrently
+from pdf_jobs import JOB_MANAGER
+from document_cache import DOCUMENT_CACHE
+from pdf_zip import ZipAssembler
+from job_view import render_job
+from diagnostics_view import render_run_diagnostics, start_run_diagnostics
+from lambda_gateway import LAMBDA_GATEWAY, CREATE_INVOICES_FUNCTION
 from order_summary_export import generate_seller_summaries
 import streamlit as st
 
@@ -12,6 +22,10 @@ import streamlit as st
 # Set the feature flags
 feature_flags = {"delivery_fees": False}
 
+INVOICES_JOB = "invoices_job"
+INVOICES_SUMMARY = "invoices_summary"
+INVOICES_DIAGNOSTICS = "invoices_diagnostics"
+
 st.set_page_config(page_title="Invoice Generator")
 
 hide_streamlit_style = """
@@ -30,7 +44,8 @@ INSTRUCTIONS = """
 3. Update the contacts spreadsheet with all contact info.
     Note:
     - Do not change the column titles
-    - The names must exactly match those in the order spreadsheet.
+    - The names must match those in the order spreadsheet.
+      Case and surrounding spaces are ignored, so no two names may differ only by those.
 4. Upload the order spreadsheets and the contacts spreadsheet below.
 5. Invoices are automatically generated. Click to download.
 """
@@ -57,71 +72,108 @@ contacts = st.file_uploader(
     "Choose Contacts Excel", type="xlsx", accept_multiple_files=False
 )
 date = st.date_input("What's the invoice date?")
+run_in_background = st.toggle("Generate in the background (for large runs)")
+show_diagnostics = st.toggle("Show run diagnostics")
+
+use_order_store = ORDER_STORE is not None and st.toggle(
+    "Invoice orders already saved in the order store instead of uploading them"
+)
+order_store_period = ()
+if use_order_store:
+    today = datetime.date.today()
+    order_store_period = st.date_input(
+        "Invoice orders delivered between", value=(today.replace(day=1), today)
+    )
+    if len(order_store_period) == 2:
+        render_stored_weeks(*order_store_period)
 
 # contacts = "example_data/FarmToFork_Invoice_Contacts.xlsx"
 # order_sheets = ["example_data/OxFarmToFork spreadsheet week 7 - 12_02_2024.xlsx", "example_data/OxFarmToFork spreadsheet week 9 - 26_02_2024.xlsx"]
 
-if st.button("Generate Invoices"):
-    if order_sheets and contacts and date:
+generate = st.button("Generate Invoices")
+if not generate and show_diagnostics:
+    render_run_diagnostics(INVOICES_DIAGNOSTICS)
+if not generate and INVOICES_JOB in st.session_state:
+    st.dataframe(st.session_state.get(INVOICES_SUMMARY))
+    render_job(INVOICES_JOB, "Invoice", "Download All Invoices")
+
+if generate:
+    st.session_state.pop(INVOICES_JOB, None)
+    start_run_diagnostics(INVOICES_DIAGNOSTICS)
+    if (order_sheets and contacts or len(order_store_period) == 2) and date:
         st.markdown("---")
 
-        contacts_parser = ContactsExcelParser()
-        contacts_import = contacts_parser.parse(contacts)
-        contacts_import.validation_report.raise_error()
-
-        order_parser = OrderExcelParser(contacts_import.buyers)
-
-        markets = []
-
-        for sheet in order_sheets:
-            market_place_import = order_parser.parse(
-                sheet, date, use_file_name_for_date=True
+        if len(order_store_period) == 2:
+            if not ORDER_STORE.weeks(*order_store_period):
+                st.warning("There are no stored orders in that period.")
+                st.stop()
+            # Loaded a week at a time each time the weeks are used
+            markets = ORDER_STORE.market_places(*order_store_period)
+        else:
+            contacts_parser = ContactsExcelParser()
+            contacts_import = PARSE_CACHE.parse_contacts(contacts, contacts_parser)
+            contacts_import.validation_report.raise_error()
+
+            order_parser = OrderExcelParser(contacts_import.buyer_directory)
+
+            market_place_imports = PARSE_CACHE.parse_many_orders(
+                order_parser, order_sheets, date, use_file_name_for_date=True
             )
-            market_place_import.validation_report.raise_error()
-            markets.append(market_place_import.market_place)
+            ValidationReport.merge(
+                [
+                    market_place_import.validation_report
+                    for market_place_import in market_place_imports
+                ]
+            ).raise_error()
+            markets = [
+                market_place_import.market_place
+                for market_place_import in market_place_imports
+            ]
+            if ORDER_STORE is not None:
+                ORDER_STORE.ingest_many(markets)
 
         summary = generate_seller_summaries(markets)
         st.dataframe(summary)
         invoices = create_invoices(markets, date)
-        order_data_json = generate_invoices_json(invoices)
-
-        Lambda = boto3.client("lambda", region_name="eu-west-2")
-        response = Lambda.invoke(
-            FunctionName="arn:aws:lambda:eu-west-2:850434255294:function:create_invoices",
-            InvocationType="RequestResponse",
-            LogType="Tail",
-            # ClientContext='str_jsoning',
-            Payload=order_data_json,
-            # Qualifier='string'
-        )
-        result = json.loads(response["Payload"].read().decode("utf-8"))
 
+        if run_in_background:
+            st.session_state[INVOICES_SUMMARY] = summary
+            st.session_state[INVOICES_JOB] = JOB_MANAGER.submit(
+                CREATE_INVOICES_FUNCTION,
+                invoices_payload(invoices),
+                "invoices",
+                zip_name=f"{date.strftime('%Y-%m-%d')} Invoice",
+            )
+            st.rerun()
+
+        zip_assembler = ZipAssembler()
         i = 0
 
-        links = []
-        for college, link in result["links"].items():
-            links.append(link)
-            encoded_link = link.replace(" ", "%20")
-            st.markdown(f"[{college} Invoice]({encoded_link})")
-            i += 1
-
-        links_data = {"links": links, "name": f"{date.strftime('%Y-%m-%d')} Invoice"}
-
-        links_json = json.dumps(links_data)
-        zipper = Lambda.invoke(
-            FunctionName="arn:aws:lambda:eu-west-2:850434255294:function:zipper",
-            InvocationType="RequestResponse",
-            LogType="Tail",
-            # ClientContext='str_jsoning',
-            Payload=links_json,
-            # Qualifier='string'
+        for chunk_links in invoke_concurrently(
+            LAMBDA_GATEWAY,
+            CREATE_INVOICES_FUNCTION,
+            invoices_payload(invoices),
+            "invoices",
+            cache=DOCUMENT_CACHE,
+        ):
+            for college, link in chunk_links.items():
+                encoded_link = link.replace(" ", "%20")
+                st.markdown(f"[{college} Invoice]({encoded_link})")
+                zip_assembler.add(link)
+                i += 1
+
+        st.download_button(
+            "Download All Invoices",
+            zip_assembler.finish(),
+            file_name=f"{date.strftime('%Y-%m-%d')} Invoice.zip",
+            mime="application/zip",
         )
-        zipper = json.loads(zipper["Payload"].read().decode("utf-8"))
-        encoded_link = zipper["zip"].replace(" ", "%20")
-        st.link_button("Download All Invoices", encoded_link)
+        if show_diagnostics:
+            render_run_diagnostics(INVOICES_DIAGNOSTICS)
 
 else:
-    st.warning(
-        "Please upload weekly order spreadsheets and contacts spreadsheet and select a date."
-    )
+    if INVOICES_JOB not in st.session_state:
+        st.warning(
+            "Please upload weekly order spreadsheets and contacts spreadsheet and select a date."
+        )
     st.stop()
@@ -2,17 +2,26 @@
 Delivery Note page
 """
 
-import json
 import re
-import boto3
 from openpyxl.reader.excel import load_workbook
 from contacts_excel_dao import ContactsExcelParser
 from order_excel_dao import OrderExcelParser
+from parse_cache import PARSE_CACHE
 from create_pick_lists import create_pick_lists
-from json_generators import generate_pick_list_json
+from json_generators import pick_lists_payload
+from pdf_dispatch import invoke_concurrently
+from pdf_jobs import JOB_MANAGER
+from document_cache import DOCUMENT_CACHE
+from pdf_zip import ZipAssembler
+from job_view import render_job
+from diagnostics_view import render_run_diagnostics, start_run_diagnostics
+from lambda_gateway import LAMBDA_GATEWAY, CREATE_PICKS_FUNCTION
 import streamlit as st
 
 
+PICK_LISTS_JOB = "pick_lists_job"
+PICK_LISTS_DIAGNOSTICS = "pick_lists_diagnostics"
+
 st.set_page_config(page_title="Pick Lists Generator")
 
 HIDE_STREAMLIT_STYLE = """
@@ -32,7 +41,8 @@ INSTRUCTIONS = """
 3. Update the contacts spreadsheet with all contact info.
     Note:
     - Do not change the column titles
-    - The "Buyer Key as in Spreadsheet" entries must exactly match those in the order spreadsheet.
+    - The "Buyer Key as in Spreadsheet" entries must match those in the order spreadsheet.
+      Case and surrounding spaces are ignored, so no two keys may differ only by those.
 4. Upload the order spreadsheet and the contacts spreadsheet below.
 5. Pick lists are automatically generated. Click to download.
 """
@@ -56,19 +66,31 @@ contacts = st.file_uploader(
     "Choose Contacts Excel", type="xlsx", accept_multiple_files=False
 )
 date = st.date_input("What is the Monday of the order week?")
+run_in_background = st.toggle("Generate in the background (for large runs)")
+show_diagnostics = st.toggle("Show run diagnostics")
 
 # prepare order number parts
 
-if st.button("Generate Pick Lists"):
+generate = st.button("Generate Pick Lists")
+if not generate:
+    if show_diagnostics:
+        render_run_diagnostics(PICK_LISTS_DIAGNOSTICS)
+    render_job(PICK_LISTS_JOB, "Pick List", "Download All Pick Lists")
+
+if generate:
+    st.session_state.pop(PICK_LISTS_JOB, None)
+    start_run_diagnostics(PICK_LISTS_DIAGNOSTICS)
     if order_sheet_file and contacts and date:
         st.markdown("---")
 
         contacts_parser = ContactsExcelParser()
-        contacts_import = contacts_parser.parse(contacts)
+        contacts_import = PARSE_CACHE.parse_contacts(contacts, contacts_parser)
         contacts_import.validation_report.raise_error()
 
-        order_parser = OrderExcelParser(contacts_import.buyers)
-        market_place_import = order_parser.parse(order_sheet_file, date)
+        order_parser = OrderExcelParser(contacts_import.buyer_directory)
+        market_place_import = PARSE_CACHE.parse_orders(
+            order_parser, order_sheet_file, date
+        )
         market_place_import.validation_report.raise_error()
 
         week_number_match = re.search(r"k (\d+)", order_sheet_file.name)
@@ -82,40 +104,39 @@ if st.button("Generate Pick Lists"):
         pick_lists = create_pick_lists(
             market_place_import.market_place, date, week_number)
 
-        pick_lists_json_export = generate_pick_list_json(pick_lists)
-
-        Lambda = boto3.client("lambda", region_name="eu-west-2")
-        response = Lambda.invoke(
-            FunctionName="arn:aws:lambda:eu-west-2:850434255294:function:create_picks",
-            InvocationType="RequestResponse",
-            LogType="Tail",
-            Payload=pick_lists_json_export,
-        )
-        result = json.loads(response["Payload"].read().decode("utf-8"))
+        if run_in_background:
+            st.session_state[PICK_LISTS_JOB] = JOB_MANAGER.submit(
+                CREATE_PICKS_FUNCTION,
+                pick_lists_payload(pick_lists),
+                "picks",
+                zip_name=f"{date.strftime('%Y-%m-%d')} Pick Lists",
+            )
+            st.rerun()
 
+        zip_assembler = ZipAssembler()
         i = 0
-        links = []
-
-        for seller, link in result["links"].items():
-            encoded_link = link.replace(" ", "%20")
-            links.append(link)
-            st.markdown(f"[{seller} Pick List]({encoded_link})")
-            i += 1
-
-        links_data = {
-            "links": links,
-            "name": f"{date.strftime('%Y-%m-%d')} Pick Lists",
-        }
-        links_json = json.dumps(links_data)
-        zipped = Lambda.invoke(
-            FunctionName="arn:aws:lambda:eu-west-2:850434255294:function:zipper",
-            InvocationType="RequestResponse",
-            LogType="Tail",
-            Payload=links_json,
+
+        for chunk_links in invoke_concurrently(
+            LAMBDA_GATEWAY,
+            CREATE_PICKS_FUNCTION,
+            pick_lists_payload(pick_lists),
+            "picks",
+            cache=DOCUMENT_CACHE,
+        ):
+            for seller, link in chunk_links.items():
+                encoded_link = link.replace(" ", "%20")
+                st.markdown(f"[{seller} Pick List]({encoded_link})")
+                zip_assembler.add(link)
+                i += 1
+
+        st.download_button(
+            "Download All Pick Lists",
+            zip_assembler.finish(),
+            file_name=f"{date.strftime('%Y-%m-%d')} Pick Lists.zip",
+            mime="application/zip",
         )
-        zipped = json.loads(zipped["Payload"].read().decode("utf-8"))
-        encoded_link = zipped["zip"].replace(" ", "%20")
-        st.link_button("Download All Pick Lists", encoded_link)
+        if show_diagnostics:
+            render_run_diagnostics(PICK_LISTS_DIAGNOSTICS)
     else:
         st.warning(
             "Please upload weekly order spreadsheet and contacts spreadsheet and select a date."
@@ -5,10 +5,17 @@ import datetime
 from datetime import datetime
 from contacts_excel_dao import ContactsExcelParser
 from order_excel_dao import OrderExcelParser
-from order_summary_export import aggregate_orders
+from parse_cache import PARSE_CACHE
+from order_store import ORDER_STORE
+from order_store_view import render_stored_weeks
+from domain import ValidationReport
+from order_summary_export import generate_summaries
+from diagnostics_view import render_run_diagnostics, start_run_diagnostics
 import streamlit as st
 
 
+ORDER_SUMMARY_DIAGNOSTICS = "order_summary_diagnostics"
+
 # Set the feature flags
 
 st.set_page_config(page_title="Order Summary Generator")
@@ -29,7 +36,8 @@ INSTRUCTIONS = """
 3. Update the contacts spreadsheet with all contact info.
     Note:
     - Do not change the column titles
-    - The names must exactly match those in the order spreadsheet.
+    - The names must match those in the order spreadsheet.
+      Case and surrounding spaces are ignored, so no two names may differ only by those.
 4. Upload the order spreadsheets and the contacts spreadsheet below.
 5. Press generate Order csv.
 6. Press download to download the csv file.
@@ -64,32 +72,72 @@ contacts = st.file_uploader(
     "Choose Contacts Excel", type="xlsx", accept_multiple_files=False
 )
 
-if st.button("Generate Order csv"):
-    if order_sheets and contacts:
-        st.markdown("---")
-
-        contacts_parser = ContactsExcelParser()
-        contacts_import = contacts_parser.parse(contacts)
-        contacts_import.validation_report.raise_error()
-
-        order_parser = OrderExcelParser(contacts_import.buyers)
+use_order_store = ORDER_STORE is not None and st.toggle(
+    "Summarise orders already saved in the order store instead of uploading them"
+)
+order_store_period = ()
+if use_order_store:
+    today = datetime.now().date()
+    order_store_period = st.date_input(
+        "Summarise orders delivered between", value=(today.replace(day=1), today)
+    )
+    if len(order_store_period) == 2:
+        render_stored_weeks(*order_store_period)
 
-        markets = []
+show_diagnostics = st.toggle("Show run diagnostics")
 
-        for sheet in order_sheets:
-            market_place_import = order_parser.parse(sheet, use_file_name_for_date=True)
-            market_place_import.validation_report.raise_error()
-            markets.append(market_place_import.market_place)
+if st.button("Generate Order csv"):
+    start_run_diagnostics(ORDER_SUMMARY_DIAGNOSTICS)
+    if order_sheets and contacts or len(order_store_period) == 2:
+        st.markdown("---")
 
-        all_orders = aggregate_orders(markets)
+        if len(order_store_period) == 2:
+            if not ORDER_STORE.weeks(*order_store_period):
+                st.warning("There are no stored orders in that period.")
+                st.stop()
+            # Loaded a week at a time each time the weeks are used
+            markets = ORDER_STORE.market_places(*order_store_period)
+        else:
+            contacts_parser = ContactsExcelParser()
+            contacts_import = PARSE_CACHE.parse_contacts(contacts, contacts_parser)
+            contacts_import.validation_report.raise_error()
+
+            order_parser = OrderExcelParser(contacts_import.buyer_directory)
+
+            market_place_imports = PARSE_CACHE.parse_many_orders(
+                order_parser, order_sheets, use_file_name_for_date=True
+            )
+            ValidationReport.merge(
+                [
+                    market_place_import.validation_report
+                    for market_place_import in market_place_imports
+                ]
+            ).raise_error()
+            markets = [
+                market_place_import.market_place
+                for market_place_import in market_place_imports
+            ]
+            if ORDER_STORE is not None:
+                ORDER_STORE.ingest_many(markets)
+
+        summaries = generate_summaries(markets)
 
         st.download_button(
             label="Download Order csv",
-            data=convert_df_to_csv(all_orders),
+            data=convert_df_to_csv(summaries.orders),
             file_name=f'Farm_to_Fork_Raw_Orders_created_{datetime.now().strftime("%Y-%m-%d")}.csv',
             mime="text/csv",
         )
 
+        st.subheader("Sellers")
+        st.dataframe(summaries.sellers)
+        st.subheader("Buyers")
+        st.dataframe(summaries.buyers)
+        st.subheader("Produce")
+        st.dataframe(summaries.produce)
+        if show_diagnostics:
+            render_run_diagnostics(ORDER_SUMMARY_DIAGNOSTICS)
+
 else:
     st.warning(
         "Please upload weekly order spreadsheets and contacts spreadsheet and select a date."
@@ -0,0 +1,135 @@
+"""
+Weekly Run page: delivery notes, pick lists and the order summary from one
+upload of the week's order sheet
+"""
+
+import datetime
+import re
+from contacts_excel_dao import ContactsExcelParser
+from order_excel_dao import OrderExcelParser
+from parse_cache import PARSE_CACHE
+from order_store import ORDER_STORE
+from weekly_run import build_weekly_run, submit_weekly_run
+from job_view import render_job, rerun_soon
+from diagnostics_view import render_run_diagnostics, start_run_diagnostics
+import streamlit as st
+
+
+DELIVERY_NOTES_JOB = "weekly_run_delivery_notes_job"
+PICK_LISTS_JOB = "weekly_run_pick_lists_job"
+SUMMARIES = "weekly_run_summaries"
+WEEKLY_RUN_DIAGNOSTICS = "weekly_run_diagnostics"
+
+st.set_page_config(page_title="Weekly Run")
+
+HIDE_STREAMLIT_STYLE = """
+            <style>
+            #MainMenu {visibility: hidden;}
+            footer {visibility: hidden;}
+            </style>
+            """
+st.markdown(HIDE_STREAMLIT_STYLE, unsafe_allow_html=True)
+
+st.title("Weekly Run")
+
+INSTRUCTIONS = """
+1. Download the weekly order Excel from the weekly link
+2. Rename the Excel to the format: OxFarmToFork spreadsheet week N - DD_MM_YYYY.xlsx
+    - Where N is the week number and DD_MM_YYYY is the delivery date
+3. Update the contacts spreadsheet with all contact info.
+4. Upload the order spreadsheet and the contacts spreadsheet below.
+5. Delivery notes, pick lists and the order summary are generated together.
+"""
+st.markdown(INSTRUCTIONS)
+
+
+@st.cache_data
+def convert_df_to_csv(df):
+    """converts dataframe to csv and encodes it to utf-8 while caching to avoid re-computation"""
+    return df.to_csv(index=False).encode("utf-8")
+
+
+order_sheet_file = st.file_uploader(
+    "Choose Weekly Order Excel. MUST be in format: "
+    "OxFarmToFork spreadsheet week N - DD_MM_YYYY.xlsx",
+    type="xlsx",
+    accept_multiple_files=False,
+)
+if order_sheet_file:
+    EXPECTED_FORMAT = r"\d+ - \d{2}_\d{2}_\d{4}\.xlsx"
+    if not re.search(EXPECTED_FORMAT, order_sheet_file.name):
+        st.error(
+            "Invalid order sheet name. Please rename the file to the format: "
+            "OxFarmToFork spreadsheet week N - DD_MM_YYYY.xlsx"
+        )
+contacts = st.file_uploader(
+    "Choose Contacts Excel", type="xlsx", accept_multiple_files=False
+)
+date = st.date_input("What's the delivery date?")
+monday_of_order_week = st.date_input(
+    "What is the Monday of the order week?",
+    value=date - datetime.timedelta(days=date.weekday()),
+)
+show_diagnostics = st.toggle("Show run diagnostics")
+
+generate = st.button("Generate Weekly Run")
+
+if generate:
+    for key in (DELIVERY_NOTES_JOB, PICK_LISTS_JOB, SUMMARIES):
+        st.session_state.pop(key, None)
+    start_run_diagnostics(WEEKLY_RUN_DIAGNOSTICS)
+
+    if order_sheet_file and contacts and date:
+        contacts_parser = ContactsExcelParser()
+        contacts_import = PARSE_CACHE.parse_contacts(contacts, contacts_parser)
+        contacts_import.validation_report.raise_error()
+
+        order_parser = OrderExcelParser(contacts_import.buyer_directory)
+        market_place_import = PARSE_CACHE.parse_orders(
+            order_parser, order_sheet_file, date, use_file_name_for_date=True
+        )
+        market_place_import.validation_report.raise_error()
+        if ORDER_STORE is not None:
+            ORDER_STORE.ingest(market_place_import.market_place)
+
+        weekly_run = build_weekly_run(
+            market_place_import.market_place, date, monday_of_order_week
+        )
+        (
+            st.session_state[DELIVERY_NOTES_JOB],
+            st.session_state[PICK_LISTS_JOB],
+        ) = submit_weekly_run(weekly_run)
+        st.session_state[SUMMARIES] = weekly_run.summaries
+    else:
+        st.warning(
+            "Please upload weekly order spreadsheet and contacts spreadsheet and select a date."
+        )
+
+summaries = st.session_state.get(SUMMARIES)
+if summaries is not None:
+    st.markdown("---")
+    st.download_button(
+        label="Download Order csv",
+        data=convert_df_to_csv(summaries.orders),
+        file_name=f"Farm_to_Fork_Raw_Orders_{date.strftime('%Y-%m-%d')}.csv",
+        mime="text/csv",
+    )
+    st.subheader("Sellers")
+    st.dataframe(summaries.sellers)
+
+    delivery_notes_column, pick_lists_column = st.columns(2)
+    with delivery_notes_column:
+        st.subheader("Delivery Notes")
+        delivery_notes_finished = render_job(
+            DELIVERY_NOTES_JOB, "Delivery Notes", "Download All Notes", poll=False
+        )
+    with pick_lists_column:
+        st.subheader("Pick Lists")
+        pick_lists_finished = render_job(
+            PICK_LISTS_JOB, "Pick List", "Download All Pick Lists", poll=False
+        )
+
+    if show_diagnostics:
+        render_run_diagnostics(WEEKLY_RUN_DIAGNOSTICS)
+    if not (delivery_notes_finished and pick_lists_finished):
+        rerun_soon()
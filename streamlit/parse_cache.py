@@ -0,0 +1,148 @@
+"""
+Content-addressed cache for parsed contacts and order spreadsheets
+"""
+
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+from domain import ContactsImport, MarketPlaceImport
+from contacts_excel_dao import ContactsExcelParser
+from order_excel_dao import PARSER_VERSION, OrderExcelParser
+
+
+class ParseCache:
+    """
+    Caches parse results keyed by a hash of the uploaded bytes, the parser
+    version and the parse arguments.
+
+    Entries are held in memory with least recently used eviction and, when a
+    directory is given, also pickled to disk so they survive restarts.
+    """
+
+    def __init__(self, max_entries: int = 32, directory: Optional[str] = None):
+        self.max_entries = max_entries
+        self.directory = directory
+        self._entries: OrderedDict[str, object] = OrderedDict()
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _key(self, file, *args) -> str:
+        """Builds the cache key from the file contents and parse arguments"""
+        digest = hashlib.sha256()
+        digest.update(f"{PARSER_VERSION}\0{file.name}\0".encode("utf-8"))
+        for arg in args:
+            digest.update(f"{arg!r}\0".encode("utf-8"))
+        digest.update(file.getvalue())
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pickle")
+
+    def _get(self, key: str):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        if self.directory and os.path.exists(self._path(key)):
+            with open(self._path(key), "rb") as cached_file:
+                value = pickle.load(cached_file)
+            self._put(key, value, persist=False)
+            return value
+        return None
+
+    def _put(self, key: str, value, persist: bool = True):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        if persist and self.directory:
+            # Write then rename so a concurrent reader never sees a partial file
+            temporary_path = f"{self._path(key)}.{threading.get_ident()}.tmp"
+            with open(temporary_path, "wb") as cached_file:
+                pickle.dump(value, cached_file)
+            os.replace(temporary_path, self._path(key))
+
+    def _get_or_parse(self, key: str, parse: Callable[[], object]):
+        value = self._get(key)
+        if value is None:
+            value = parse()
+            self._put(key, value)
+        return value
+
+    def clear(self):
+        """Drops all in-memory entries"""
+        with self._lock:
+            self._entries.clear()
+
+    def parse_contacts(
+        self, file, parser: Optional[ContactsExcelParser] = None
+    ) -> ContactsImport:
+        """
+        Parses the contacts spreadsheet, reusing the cached import if the same
+        bytes have been parsed before
+        """
+        parser = parser or ContactsExcelParser()
+        key = self._key(file, "contacts")
+        return self._get_or_parse(key, lambda: parser.parse(file))
+
+    def _order_key(
+        self, parser: OrderExcelParser, file, delivery_date, use_file_name_for_date
+    ) -> str:
+        buyers = sorted(repr(buyer) for buyer in parser.buyers)
+        return self._key(file, "orders", buyers, delivery_date, use_file_name_for_date)
+
+    def parse_orders(
+        self,
+        parser: OrderExcelParser,
+        file,
+        delivery_date=None,
+        use_file_name_for_date=False,
+    ) -> MarketPlaceImport:
+        """
+        Parses an order spreadsheet, reusing the cached import if the same
+        bytes have been parsed before with the same contacts and arguments
+        """
+        key = self._order_key(parser, file, delivery_date, use_file_name_for_date)
+        return self._get_or_parse(
+            key, lambda: parser.parse(file, delivery_date, use_file_name_for_date)
+        )
+
+    def parse_many_orders(
+        self,
+        parser: OrderExcelParser,
+        files: list,
+        delivery_date=None,
+        use_file_name_for_date=False,
+        max_workers: Optional[int] = None,
+    ) -> list[MarketPlaceImport]:
+        """
+        Parses several order spreadsheets, sending only the cache misses to
+        OrderExcelParser.parse_many
+        """
+        keys = [
+            self._order_key(parser, file, delivery_date, use_file_name_for_date)
+            for file in files
+        ]
+        imports = [self._get(key) for key in keys]
+        missing = [i for i, cached in enumerate(imports) if cached is None]
+
+        if missing:
+            parsed = parser.parse_many(
+                [files[i] for i in missing],
+                delivery_date,
+                use_file_name_for_date,
+                max_workers=max_workers,
+            )
+            for i, market_place_import in zip(missing, parsed):
+                self._put(keys[i], market_place_import)
+                imports[i] = market_place_import
+
+        return imports
+
+
+PARSE_CACHE = ParseCache(directory=os.environ.get("F2F_PARSE_CACHE_DIR"))
@@ -0,0 +1,137 @@
+"""
+Sends the JSON payloads to the PDF Lambdas in batches small enough for a
+synchronous invoke
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Iterator, Optional
+from document_cache import DocumentCache, content_hash
+from instrumentation import span, submit_in_context
+from json_generators import encode_payload
+from lambda_gateway import LambdaGateway
+
+# Lambda caps a synchronous request payload at 6 MB; keep a margin below it
+MAX_PAYLOAD_BYTES = 6_000_000
+# Documents per concurrent invoke, and the most invokes queued at once; the
+# gateway's adaptive limit decides how many of them are in flight
+CHUNK_DOCUMENTS = 10
+MAX_WORKERS = 32
+
+# The name each PDF function returns a document's link under
+DOCUMENT_NAMES: dict[str, Callable[[dict], str]] = {
+    "orders": lambda note: note["buyer"]["name"],
+    "invoices": lambda invoice: invoice["buyer"]["name"],
+    "picks": lambda pick: pick["seller"]["name"],
+}
+
+
+def shard_payload(
+    payload: dict,
+    key: str,
+    max_bytes: int = MAX_PAYLOAD_BYTES,
+    max_documents: Optional[int] = None,
+) -> list[bytes]:
+    """
+    Splits the documents under payload[key] into encoded payloads of at most
+    max_bytes and max_documents each, keeping every document whole
+
+    Each document is encoded once and the batches are joined from the
+    encoded documents.
+    """
+    with span("serialise", key=key, documents=len(payload[key])) as counts:
+        envelope = encode_payload(
+            {**{name: value for name, value in payload.items() if name != key}, key: []}
+        )
+        if not envelope.endswith(b"[]}"):
+            raise ValueError(f"Could not build a batch envelope for {key}.")
+        prefix, suffix = envelope[:-3] + b"[", b"]}"
+        overhead = len(prefix) + len(suffix)
+
+        batches: list[bytes] = []
+        batch: list[bytes] = []
+        batch_bytes = overhead
+
+        for document in payload[key]:
+            encoded = encode_payload(document)
+            if overhead + len(encoded) > max_bytes:
+                raise ValueError(
+                    f"A single {key} document is {len(encoded)} bytes, "
+                    f"over the {max_bytes} byte payload limit."
+                )
+            separator = 1 if batch else 0
+            if batch_bytes + separator + len(encoded) > max_bytes or (
+                max_documents is not None and len(batch) >= max_documents
+            ):
+                batches.append(prefix + b",".join(batch) + suffix)
+                batch, batch_bytes, separator = [], overhead, 0
+            batch.append(encoded)
+            batch_bytes += separator + len(encoded)
+
+        if batch or not batches:
+            batches.append(prefix + b",".join(batch) + suffix)
+        counts["payload_bytes"] = sum(map(len, batches))
+        counts["batches"] = len(batches)
+
+    return batches
+
+
+def _invoke_batch(
+    gateway: LambdaGateway, function_name: str, batch: bytes
+) -> dict[str, str]:
+    """Invokes a PDF Lambda with one batch and returns its links"""
+    return gateway.invoke(function_name, batch)["links"]
+
+
+def invoke_concurrently(
+    gateway: LambdaGateway,
+    function_name: str,
+    payload: dict,
+    key: str,
+    max_documents: int = CHUNK_DOCUMENTS,
+    max_workers: int = MAX_WORKERS,
+    max_bytes: int = MAX_PAYLOAD_BYTES,
+    cache: Optional[DocumentCache] = None,
+) -> Iterator[dict[str, str]]:
+    """
+    Invokes a PDF Lambda for chunks of documents in parallel, yielding each
+    chunk's links as soon as it finishes
+
+    With a cache, documents generated before with the same content are not
+    sent; their links are yielded first, as one chunk. Chunks still waiting
+    to start are cancelled if one fails or the caller stops early.
+    """
+    pending_hashes: dict[str, str] = {}
+    if cache is not None:
+        name_of = DOCUMENT_NAMES[key]
+        cached_links: dict[str, str] = {}
+        pending = []
+        for document in payload[key]:
+            document_hash = content_hash(function_name, document)
+            link = cache.get(document_hash)
+            if link is None:
+                pending.append(document)
+                pending_hashes[name_of(document)] = document_hash
+            else:
+                cached_links[name_of(document)] = link
+        if cached_links:
+            yield cached_links
+        if not pending:
+            return
+        payload = {**payload, key: pending}
+
+    batches = shard_payload(payload, key, max_bytes, max_documents)
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches))))
+    try:
+        futures = [
+            submit_in_context(executor, _invoke_batch, gateway, function_name, batch)
+            for batch in batches
+        ]
+        for future in as_completed(futures):
+            links = future.result()
+            if cache is not None:
+                for name, link in links.items():
+                    if name in pending_hashes:
+                        cache.put(pending_hashes[name], link)
+            yield links
+    finally:
+        executor.shutdown(cancel_futures=True)
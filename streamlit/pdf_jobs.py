@@ -0,0 +1,230 @@
+"""
+Background jobs for PDF generation, so a long run is not tied to one
+blocking page run and its progress can be polled by ID
+"""
+
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Optional
+from document_cache import DOCUMENT_CACHE, DocumentCache
+from instrumentation import submit_in_context
+from lambda_gateway import LAMBDA_GATEWAY, LambdaGateway
+from pdf_dispatch import invoke_concurrently
+from pdf_zip import ZipAssembler
+
+# Finished jobs' zips are kept on disk until they are evicted, oldest first,
+# to keep at most this many bytes
+MAX_RETAINED_BYTES = 1_000_000_000
+
+
+@dataclass(frozen=True)
+class JobStatus:
+    """
+    A snapshot of a job's progress
+    """
+
+    job_id: str
+    state: str
+    total: int
+    links: dict[str, str]
+    zip_name: Optional[str]
+    zip_path: Optional[str]
+    error: Optional[str]
+    elapsed: float
+
+    @property
+    def progress(self) -> float:
+        """The fraction of documents generated so far"""
+        if self.state == "done" or self.total == 0:
+            return 1.0
+        return min(1.0, len(self.links) / self.total)
+
+    @property
+    def finished(self) -> bool:
+        """Whether the job has completed or failed"""
+        return self.state in ("done", "failed")
+
+    def read_zip(self) -> Optional[bytes]:
+        """The job's zip, or None if it has none or it has since expired"""
+        if self.zip_path is None:
+            return None
+        try:
+            with open(self.zip_path, "rb") as zip_file:
+                return zip_file.read()
+        except FileNotFoundError:
+            return None
+
+
+class _Job:
+    def __init__(self, job_id: str, total: int, zip_name: Optional[str]):
+        self.job_id = job_id
+        self.total = total
+        self.state = "queued"
+        self.links: dict[str, str] = {}
+        self.zip_name = zip_name
+        self.zip_path: Optional[str] = None
+        self.zip_bytes = 0
+        self.error: Optional[str] = None
+        self.submitted = time.monotonic()
+        self.finished: Optional[float] = None
+
+    def discard_zip(self):
+        """Deletes the job's zip file, if it has one"""
+        if self.zip_path is not None:
+            try:
+                os.remove(self.zip_path)
+            except FileNotFoundError:
+                pass
+
+
+class JobManager:
+    """
+    Runs PDF generation jobs on a small pool of background threads and keeps
+    the state of the most recent ones, keyed by job ID
+
+    Each job's zip is written to a temporary file rather than held in memory.
+    Finished jobs are evicted, oldest first, beyond max_jobs jobs or
+    max_retained_bytes of zips. Jobs still queued or running are never
+    evicted.
+    """
+
+    def __init__(
+        self,
+        gateway: LambdaGateway,
+        max_running: int = 2,
+        max_jobs: int = 20,
+        max_retained_bytes: int = MAX_RETAINED_BYTES,
+        cache: Optional[DocumentCache] = None,
+        fetch: Optional[Callable[[str], bytes]] = None,
+    ):
+        self.gateway = gateway
+        self.cache = cache
+        self.fetch = fetch
+        self.max_jobs = max_jobs
+        self.max_retained_bytes = max_retained_bytes
+        self._directory = tempfile.TemporaryDirectory(prefix="f2f-jobs-")
+        self._lock = threading.Lock()
+        self._jobs: OrderedDict[str, _Job] = OrderedDict()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_running, thread_name_prefix="pdf-job"
+        )
+
+    def submit(
+        self,
+        function_name: str,
+        payload: dict,
+        key: str,
+        zip_name: Optional[str] = None,
+    ) -> str:
+        """
+        Queues the documents under payload[key] for generation, zipping the
+        documents as zip_name if given, and returns the job's ID
+        """
+        job = _Job(uuid.uuid4().hex, len(payload[key]), zip_name)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._evict()
+        submit_in_context(
+            self._executor, self._run, job, function_name, payload, key
+        )
+        return job.job_id
+
+    def _evict(self, keep: Optional[_Job] = None):
+        """
+        Drops the oldest finished jobs, other than keep, while over either
+        bound
+        """
+        retained_bytes = sum(job.zip_bytes for job in self._jobs.values())
+        finished = [
+            job
+            for job in self._jobs.values()
+            if job.finished is not None and job is not keep
+        ]
+        while finished and (
+            len(self._jobs) > self.max_jobs
+            or retained_bytes > self.max_retained_bytes
+        ):
+            job = finished.pop(0)
+            del self._jobs[job.job_id]
+            retained_bytes -= job.zip_bytes
+            job.discard_zip()
+
+    def _run(
+        self,
+        job: _Job,
+        function_name: str,
+        payload: dict,
+        key: str,
+    ):
+        with self._lock:
+            job.state = "running"
+        zip_file, zip_assembler = None, None
+        if job.zip_name is not None:
+            zip_file = tempfile.NamedTemporaryFile(
+                dir=self._directory.name, suffix=".zip", delete=False
+            )
+            zip_assembler = ZipAssembler(fetch=self.fetch, file=zip_file)
+        try:
+            for chunk_links in invoke_concurrently(
+                self.gateway, function_name, payload, key, cache=self.cache
+            ):
+                with self._lock:
+                    job.links.update(chunk_links)
+                if zip_assembler is not None:
+                    for link in chunk_links.values():
+                        zip_assembler.add(link)
+            if zip_assembler is not None:
+                zip_bytes = zip_assembler.close()
+                zip_file.close()
+                with self._lock:
+                    job.zip_path, job.zip_bytes = zip_file.name, zip_bytes
+            state, error = "done", None
+        except Exception as exception:  # pylint: disable=broad-except
+            if zip_assembler is not None:
+                zip_assembler.cancel()
+                zip_file.close()
+                os.remove(zip_file.name)
+            state, error = "failed", str(exception) or type(exception).__name__
+        with self._lock:
+            job.state, job.error = state, error
+            job.finished = time.monotonic()
+            self._evict(keep=job)
+
+    def status(self, job_id: str) -> Optional[JobStatus]:
+        """The current state of a job, or None if it is unknown or expired"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return JobStatus(
+                job_id=job.job_id,
+                state=job.state,
+                total=job.total,
+                links=dict(job.links),
+                zip_name=job.zip_name,
+                zip_path=job.zip_path,
+                error=job.error,
+                elapsed=(job.finished or time.monotonic()) - job.submitted,
+            )
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> JobStatus:
+        """Polls until a job finishes or the timeout passes"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            status = self.status(job_id)
+            if status is None:
+                raise KeyError(job_id)
+            if status.finished or (
+                deadline is not None and time.monotonic() >= deadline
+            ):
+                return status
+            time.sleep(0.05)
+
+
+JOB_MANAGER = JobManager(LAMBDA_GATEWAY, cache=DOCUMENT_CACHE)
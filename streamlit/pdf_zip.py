@@ -0,0 +1,128 @@
+"""
+Builds the zip of generated PDFs in the app, downloading each PDF as soon as
+its link comes back instead of asking the zipper Lambda to fetch them all
+again afterwards
+"""
+
+import io
+import os
+import threading
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO, Callable, Optional
+from urllib.parse import unquote
+import requests
+from requests.adapters import HTTPAdapter
+from instrumentation import span
+
+MAX_DOWNLOADS = 8
+DOWNLOAD_TIMEOUT = (5, 60)
+
+_session_lock = threading.Lock()
+_session: Optional[requests.Session] = None
+
+
+def _shared_session() -> requests.Session:
+    """A process-wide session, so connections to the bucket are reused"""
+    global _session  # pylint: disable=global-statement
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_DOWNLOADS)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def download(link: str) -> bytes:
+    """Downloads a generated document"""
+    response = _shared_session().get(
+        requests.utils.requote_uri(link), timeout=DOWNLOAD_TIMEOUT
+    )
+    response.raise_for_status()
+    return response.content
+
+
+def entry_name(link: str) -> str:
+    """The name of a document in the zip: its object key, as the zipper uses"""
+    return unquote(link.rsplit("/", 1)[-1])
+
+
+def _default_fetch() -> Callable[[str], bytes]:
+    if os.environ.get("F2F_LOCAL_LAMBDA"):
+        # pylint: disable=import-outside-toplevel
+        from local_lambda import fetch
+
+        return fetch
+    return download
+
+
+class ZipAssembler:
+    """
+    Downloads documents on a bounded pool as their links are added, writing
+    each into a zip as soon as it arrives
+
+    The zip is written to file, or to memory if no file is given. PDFs are
+    already compressed, so they are stored rather than deflated.
+    """
+
+    def __init__(
+        self,
+        max_downloads: int = MAX_DOWNLOADS,
+        fetch: Optional[Callable[[str], bytes]] = None,
+        file: Optional[BinaryIO] = None,
+    ):
+        self._fetch = fetch or _default_fetch()
+        self._file = io.BytesIO() if file is None else file
+        self._zip = zipfile.ZipFile(self._file, "w", zipfile.ZIP_STORED)
+        self._zip_lock = threading.Lock()
+        self._names: set[str] = set()
+        self._cancelled = False
+        self._futures: list[Future] = []
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_downloads, thread_name_prefix="pdf-zip"
+        )
+
+    def add(self, link: str):
+        """Starts downloading a document into the zip"""
+        self._futures.append(self._executor.submit(self._add, link))
+
+    def _add(self, link: str):
+        data = self._fetch(link)
+        with self._zip_lock:
+            name = entry_name(link)
+            if self._cancelled or name in self._names:
+                return
+            self._names.add(name)
+            self._zip.writestr(name, data)
+
+    def cancel(self):
+        """Abandons the zip, cancelling downloads that have not started"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        with self._zip_lock:
+            self._cancelled = True
+            self._zip.close()
+
+    def close(self) -> int:
+        """
+        Waits for the remaining downloads and completes the zip, returning its
+        size in bytes
+
+        Raises the first download error, if any download failed.
+        """
+        with span("zip", documents=len(self._futures)) as counts:
+            try:
+                for future in self._futures:
+                    future.result()
+            finally:
+                self._executor.shutdown(cancel_futures=True)
+            with self._zip_lock:
+                self._zip.close()
+            counts["zip_bytes"] = self._file.seek(0, io.SEEK_END)
+        return counts["zip_bytes"]
+
+    def finish(self) -> bytes:
+        """Completes the zip, as close does, and returns its contents"""
+        self.close()
+        self._file.seek(0)
+        return self._file.read()
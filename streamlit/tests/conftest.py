@@ -0,0 +1,9 @@
+"""
+Makes the app's modules importable from the tests, as they are when the app
+is run from this directory
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
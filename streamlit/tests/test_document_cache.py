@@ -0,0 +1,96 @@
+"""
+Tests for the document cache against the local Lambda stand-in, which like
+the real PDF functions writes each document to a fixed key
+"""
+
+from document_cache import DocumentCache
+from lambda_gateway import CREATE_ORDERS_FUNCTION, LambdaGateway
+from local_lambda import LocalLambdaClient
+from pdf_dispatch import invoke_concurrently
+
+
+def _delivery_note(quantity: float) -> dict:
+    return {
+        "date": "2024-05-14",
+        "buyer": {"name": "Balliol", "number": "F2FD20241"},
+        "lines": [
+            {
+                "produce": "Carrots",
+                "variant": "",
+                "unit": "kg",
+                "price": 150,
+                "qty": quantity,
+                "seller": "Grower",
+            }
+        ],
+    }
+
+
+def _generate(gateway: LambdaGateway, cache: DocumentCache, note: dict) -> dict:
+    links = {}
+    for chunk_links in invoke_concurrently(
+        gateway, CREATE_ORDERS_FUNCTION, {"orders": [note]}, "orders", cache=cache
+    ):
+        links.update(chunk_links)
+    return links
+
+
+def test_rerendering_earlier_content_to_the_same_key_is_not_a_cache_hit():
+    client = LocalLambdaClient()
+    gateway = LambdaGateway(client_factory=lambda: client)
+    cache = DocumentCache(store={})
+    content_x, content_y = _delivery_note(2), _delivery_note(3)
+
+    first_links = _generate(gateway, cache, content_x)
+    second_links = _generate(gateway, cache, content_y)
+    assert second_links == first_links, "the stand-in writes both to one key"
+    assert len(client.calls) == 2
+
+    # The key now holds Y, so going back to X must render it again
+    _generate(gateway, cache, content_x)
+    assert len(client.calls) == 3
+    assert client.calls[-1][1]["orders"] == [content_x]
+
+    # Unchanged content is still served from the cache
+    _generate(gateway, cache, content_x)
+    assert len(client.calls) == 3
+
+
+def test_a_stale_hash_in_the_store_is_not_served_after_a_restart():
+    store = {}
+    DocumentCache(store=store).put("hash-x", "https://bucket/Balliol.pdf")
+    DocumentCache(store=store).put("hash-y", "https://bucket/Balliol.pdf")
+
+    cache = DocumentCache(store=store)
+    assert cache.get("hash-x") is None
+    assert cache.get("hash-y") == "https://bucket/Balliol.pdf"
+
+
+
+def test_an_expired_link_is_not_served():
+    now = [0.0]
+    store = {}
+    cache = DocumentCache(store=store, max_age=100, clock=lambda: now[0])
+    cache.put("hash-x", "https://bucket/Balliol.pdf")
+
+    now[0] = 100
+    assert cache.get("hash-x") == "https://bucket/Balliol.pdf"
+
+    now[0] = 101
+    assert cache.get("hash-x") is None
+    assert len(cache) == 0
+    assert store == {}, "the bucket may already have deleted the document"
+
+
+def test_an_expired_link_in_the_store_is_not_served_after_a_restart():
+    now = [0.0]
+    store = {}
+    DocumentCache(store=store, clock=lambda: now[0]).put(
+        "hash-x", "https://bucket/Balliol.pdf"
+    )
+
+    now[0] = 26 * 24 * 60 * 60
+    cache = DocumentCache(store=store, clock=lambda: now[0])
+    assert cache.get("hash-x") is None
+    assert len(cache) == 0
+    assert store == {}
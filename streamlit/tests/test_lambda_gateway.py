@@ -0,0 +1,43 @@
+"""
+Tests for which Lambda invocation errors the gateway retries
+"""
+
+import pytest
+from botocore.exceptions import EndpointConnectionError, ReadTimeoutError
+from lambda_gateway import CREATE_ORDERS_FUNCTION, LambdaGateway
+from local_lambda import LocalLambdaClient
+
+
+class _FailingClient(LocalLambdaClient):
+    """The local stand-in, raising the given errors on its first invokes"""
+
+    def __init__(self, *errors: Exception):
+        super().__init__()
+        self.errors = list(errors)
+        self.attempts = 0
+
+    def invoke(self, **kwargs) -> dict:
+        self.attempts += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return super().invoke(**kwargs)
+
+
+def _gateway(client: LocalLambdaClient) -> LambdaGateway:
+    return LambdaGateway(client_factory=lambda: client, sleep=lambda _: None)
+
+
+def test_a_read_timeout_is_not_retried():
+    client = _FailingClient(ReadTimeoutError(endpoint_url="https://lambda"))
+
+    with pytest.raises(ReadTimeoutError):
+        _gateway(client).invoke(CREATE_ORDERS_FUNCTION, '{"orders": []}')
+    assert client.attempts == 1
+
+
+def test_a_connection_error_is_retried():
+    client = _FailingClient(EndpointConnectionError(endpoint_url="https://lambda"))
+
+    result = _gateway(client).invoke(CREATE_ORDERS_FUNCTION, '{"orders": []}')
+    assert result == {"links": {}}
+    assert client.attempts == 2
@@ -0,0 +1,89 @@
+"""
+Tests that the bulk price and quantity parse matches parsing cell by cell
+"""
+
+import numpy as np
+from order_excel_dao import ExcelCoords, OrderExcelParser, ParseContext
+
+PRICE_COLUMN = 1
+BUYER_COLUMNS = [3, 4, 5]
+
+# Cell values as openpyxl returns them, in the price and buyer columns
+CELLS = [
+    1.5,
+    2,
+    0,
+    0.0,
+    None,
+    "",
+    "  ",
+    "abc",
+    "n/a",
+    -2,
+    -1.25,
+    "-3",
+    "£1.50",
+    "£ 2",
+    "£1,000.00",
+    "1.2.3",
+    "3 kg",
+    1.005,
+    2.675,
+    1e-5,
+    1e20,
+    float("nan"),
+    float("inf"),
+    True,
+    12345678,
+]
+
+
+def _rows() -> list[tuple]:
+    """Rows covering every cell value in the price and each buyer column"""
+    rows = []
+    for i, price in enumerate(CELLS):
+        quantities = [CELLS[(i + shift) % len(CELLS)] for shift in (0, 7, 13)]
+        rows.append(("Carrots", price, "kg", *quantities))
+    return rows
+
+
+def _parse_per_cell(
+    parser: OrderExcelParser,
+    rows: list[tuple],
+    row_numbers: list[int],
+    context: ParseContext,
+) -> tuple[list[int], np.ndarray]:
+    prices = []
+    quantities = np.zeros((len(rows), len(BUYER_COLUMNS)))
+    for r, (row, row_number) in enumerate(zip(rows, row_numbers)):
+        prices.append(
+            parser._parse_price(
+                row[PRICE_COLUMN], ExcelCoords(row_number, PRICE_COLUMN), context
+            )
+        )
+        for c, column in enumerate(BUYER_COLUMNS):
+            quantities[r, c] = parser._parse_quantity(
+                row[column], ExcelCoords(row_number, column), context
+            )
+    return prices, quantities
+
+
+def test_the_bulk_parse_matches_the_per_cell_parse():
+    parser = OrderExcelParser([])
+    rows = _rows()
+    row_numbers = [4 + 2 * i for i in range(len(rows))]
+
+    per_cell_context = ParseContext(source="sheet.xlsx")
+    expected_prices, expected_quantities = _parse_per_cell(
+        parser, rows, row_numbers, per_cell_context
+    )
+    bulk_context = ParseContext(source="sheet.xlsx")
+    prices, quantities = parser._bulk_parse_prices_and_quantities(
+        rows, row_numbers, PRICE_COLUMN, BUYER_COLUMNS, bulk_context
+    )
+
+    assert prices == expected_prices
+    assert all(type(price) is int for price in prices)
+    np.testing.assert_array_equal(quantities, expected_quantities)
+    assert per_cell_context.validation_errors, "the cells include bad values"
+    assert bulk_context.validation_errors == per_cell_context.validation_errors
@@ -0,0 +1,135 @@
+"""
+Tests for the background PDF jobs against the local Lambda stand-in
+"""
+
+import io
+import os
+import threading
+import time
+import zipfile
+import local_lambda
+from lambda_gateway import CREATE_ORDERS_FUNCTION, LambdaGateway
+from local_lambda import LocalLambdaClient
+from pdf_jobs import JobManager
+
+TIMEOUT = 10
+
+
+def _payload(*buyers: str) -> dict:
+    return {
+        "orders": [
+            {
+                "date": "2024-05-14",
+                "buyer": {"name": buyer, "number": f"F2FD2024{i}"},
+                "lines": [],
+            }
+            for i, buyer in enumerate(buyers)
+        ]
+    }
+
+
+class _HeldOrders:
+    """
+    A delivery notes handler that holds every call until released, counting
+    the calls that have started
+    """
+
+    def __init__(self):
+        self.started = threading.Semaphore(0)
+        self.release = threading.Event()
+
+    def __call__(self, event: dict) -> dict:
+        self.started.release()
+        assert self.release.wait(TIMEOUT), "the test never released the call"
+        return local_lambda.create_orders(event)
+
+    def wait_for_calls(self, count: int):
+        for _ in range(count):
+            assert self.started.acquire(timeout=TIMEOUT)
+
+
+def _manager(handler, **kwargs) -> JobManager:
+    client = LocalLambdaClient(handlers={"create_orders": handler})
+    gateway = LambdaGateway(client_factory=lambda: client, sleep=lambda _: None)
+    return JobManager(gateway, fetch=local_lambda.fetch, **kwargs)
+
+
+def _state(manager: JobManager, job_id: str):
+    status = manager.status(job_id)
+    return None if status is None else status.state
+
+
+def _wait_until_settled(manager: JobManager, job_ids: list[str]):
+    """Waits until every job has finished or been evicted"""
+    deadline = time.monotonic() + TIMEOUT
+    while time.monotonic() < deadline:
+        statuses = [manager.status(job_id) for job_id in job_ids]
+        if all(status is None or status.finished for status in statuses):
+            return
+        time.sleep(0.01)
+    raise AssertionError("the jobs did not finish")
+
+
+def test_a_job_runs_to_completion_with_its_zip_on_disk():
+    handler = _HeldOrders()
+    manager = _manager(handler, max_running=1)
+    first = manager.submit(
+        CREATE_ORDERS_FUNCTION, _payload("Balliol", "Keble"), "orders", "first"
+    )
+    second = manager.submit(
+        CREATE_ORDERS_FUNCTION, _payload("Wadham"), "orders", "second"
+    )
+
+    handler.wait_for_calls(1)
+    states = [_state(manager, first), _state(manager, second)]
+    handler.release.set()
+    assert states == ["running", "queued"]
+
+    status = manager.wait(first, TIMEOUT)
+    assert status.state == "done"
+    assert status.error is None
+    assert set(status.links) == {"Balliol", "Keble"}
+    assert os.path.isfile(status.zip_path)
+    with zipfile.ZipFile(io.BytesIO(status.read_zip())) as archive:
+        assert sorted(archive.namelist()) == [
+            "Balliol Delivery Note.pdf",
+            "Keble Delivery Note.pdf",
+        ]
+    assert manager.wait(second, TIMEOUT).state == "done"
+
+
+def test_a_failing_invocation_fails_the_job():
+    def crash(event: dict) -> dict:
+        raise RuntimeError("the renderer crashed")
+
+    manager = _manager(crash)
+    job_id = manager.submit(
+        CREATE_ORDERS_FUNCTION, _payload("Balliol"), "orders", "notes"
+    )
+
+    status = manager.wait(job_id, TIMEOUT)
+    assert status.state == "failed"
+    assert "the renderer crashed" in status.error
+    assert status.zip_path is None
+    assert status.read_zip() is None
+
+
+def test_eviction_never_removes_a_running_job():
+    handler = _HeldOrders()
+    manager = _manager(handler, max_running=3, max_jobs=1)
+    job_ids = [
+        manager.submit(CREATE_ORDERS_FUNCTION, _payload(buyer), "orders", buyer)
+        for buyer in ("Balliol", "Keble", "Wadham")
+    ]
+
+    handler.wait_for_calls(3)
+    states = [_state(manager, job_id) for job_id in job_ids]
+    handler.release.set()
+    assert states == ["running"] * 3
+
+    _wait_until_settled(manager, job_ids)
+    retained = [manager.status(job_id) for job_id in job_ids]
+    retained = [status for status in retained if status is not None]
+    assert len(retained) == 1
+    assert retained[0].state == "done"
+    assert retained[0].read_zip() is not None
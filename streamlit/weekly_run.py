@@ -0,0 +1,84 @@
+"""
+The weekly run: delivery notes, pick lists and the order summary built from
+one parse of the week's order sheet, with both PDF jobs dispatched together
+"""
+
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Optional
+from create_delivery_notes import create_delivery_notes
+from create_pick_lists import create_pick_lists
+from domain import DeliveryNote, MarketPlace, PickList
+from json_generators import delivery_notes_payload, pick_lists_payload
+from lambda_gateway import CREATE_ORDERS_FUNCTION, CREATE_PICKS_FUNCTION
+from order_summary_export import OrderSummaries, generate_summaries
+from pdf_jobs import JOB_MANAGER, JobManager
+
+
+@dataclass(frozen=True)
+class WeeklyRun:
+    """
+    Everything built for one week's market place
+    """
+
+    market_place: MarketPlace
+    delivery_date: date
+    monday_of_order_week: date
+    delivery_notes: list[DeliveryNote]
+    pick_lists: list[PickList]
+    summaries: OrderSummaries
+
+
+def build_weekly_run(
+    market_place: MarketPlace,
+    delivery_date: date,
+    monday_of_order_week: Optional[date] = None,
+) -> WeeklyRun:
+    """
+    Builds the delivery notes, pick lists and summaries from one market place
+
+    The order week's Monday defaults to the Monday of the delivery week.
+    """
+    if monday_of_order_week is None:
+        monday_of_order_week = delivery_date - timedelta(
+            days=delivery_date.weekday()
+        )
+
+    return WeeklyRun(
+        market_place=market_place,
+        delivery_date=delivery_date,
+        monday_of_order_week=monday_of_order_week,
+        delivery_notes=create_delivery_notes(
+            market_place, delivery_date, market_place.week
+        ),
+        pick_lists=create_pick_lists(
+            market_place, monday_of_order_week, market_place.week
+        ),
+        summaries=generate_summaries([market_place]),
+    )
+
+
+def submit_weekly_run(
+    weekly_run: WeeklyRun, job_manager: JobManager = JOB_MANAGER
+) -> tuple[str, str]:
+    """
+    Submits the delivery notes and pick lists jobs, which run concurrently,
+    returning their job IDs
+    """
+    delivery_date = weekly_run.delivery_date.strftime("%Y-%m-%d")
+    monday_of_order_week = weekly_run.monday_of_order_week.strftime("%Y-%m-%d")
+
+    delivery_notes_job = job_manager.submit(
+        CREATE_ORDERS_FUNCTION,
+        delivery_notes_payload(weekly_run.delivery_notes),
+        "orders",
+        zip_name=f"{delivery_date} Delivery Notes",
+    )
+    pick_lists_job = job_manager.submit(
+        CREATE_PICKS_FUNCTION,
+        pick_lists_payload(weekly_run.pick_lists),
+        "picks",
+        zip_name=f"{monday_of_order_week} Pick Lists",
+    )
+    return delivery_notes_job, pick_lists_job
+